@@ -1,163 +1,81 @@
 import json
 import sys
-import re
-import pdfplumber
+import datetime
 import os
+import gzip
 import tempfile
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
 from flask import Flask, request, jsonify, render_template
 from flask_cors import CORS
+from itsdangerous import URLSafeTimedSerializer, BadSignature, SignatureExpired
 from typing import Tuple # 匯入 Tuple 型別
 from dotenv import load_dotenv
 
+# (選用) 有安裝 brotli 才提供 br 壓縮，否則只用 gzip
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
 #關閉flask 語法 deactivate
-# === 新增：Groq 官方套件 ===
-from groq import Groq
 
 load_dotenv()
 
-# === 初始化 Groq 客戶端 ===
-# 它會自動去讀取環境變數中的 GROQ_API_KEY，所以不用手動填
-client = Groq()
+# ==========================================
+#  (效能) 延遲載入：Groq 用到時才初始化 (pdfplumber 見 pdf_parser.get_pdfplumber)
+# ==========================================
+# groq SDK 匯入很慢，而且 Groq() 在缺少 GROQ_API_KEY 時會直接丟錯。
+# 改成第一次使用時才載入，讓 import app 變快，聊天設定錯誤也不會害整個服務起不來。
+_lazy_lock = threading.Lock()
+_llm_client = None
 
 
-# === 匯入剛剛寫好的資料庫模組 ===
-from save_to_db import save_student_data,get_student_data_from_db, check_user_exists
+def get_llm_client():
+    """
+    第一次呼叫聊天 API 時才建立 Groq 客戶端。
+    它會自動去讀取環境變數中的 GROQ_API_KEY，所以不用手動填。
+    """
+    global _llm_client
+    if _llm_client is None:
+        with _lazy_lock:
+            if _llm_client is None:
+                from groq import Groq
+                _llm_client = Groq()
+    return _llm_client
 
-# ======================================================================
-# 
-#                           PART 1: PDF 解析
-# 
-# ======================================================================
 
-# (這是 message_idx: 75 的效能優化版 Regex)
-COURSE_PATTERN = re.compile(
-    r"^\s*"  # 匹配行首的任何空白
-    r"(?P<系所>本系|外系|--)\s+"
-    r"(?P<課號>[A-Z0-9.]+)\s+"
-    r"(?:" 
-    r"(?P<冊_full>\d+)\s+(?P<學年_full>\d+)\s+(?P<期_full>\d+)"
-    r"|" 
-    r"(?P<期_only>\d+)"
-    r")\s+" 
-    r"(?P<課名>.+?)\s+"
-    
-    # (已優化排序，最長的放前面)
-    r"(?P<選別>系必修|院必修|共同必修|共必|通識|系必|選)\s+"
-    
-    r"(?P<得分>通過|未過)\s+"
-    r"(?P<學分>\d)\s+"
-    r"(?P<累計>\d+)\s+"
-    r"(?P<分數>#|\*|\d+|Pass)\s*"
-    r"(?P<說明>.*)?$"
-)
+def warm_up():
+    """
+    (預熱) 給 pre-fork 伺服器使用，例如 gunicorn --preload wsgi:app。
+    在 master 先把重量級模組載入，fork 出來的 worker 就能共用這些記憶體分頁。
 
-# (新) 抓取學生資訊的 Regex
-YEAR_PATTERN = re.compile(r"修業年度:\s*(\d+)")
-STUDENT_PATTERN = re.compile(r"(\d{7,})\s+([\u4e00-\u9fa5]+)\s+([\u4e00-\u9fa5\s]+)")
+    Groq 客戶端刻意不在這裡建立：它內含連線池，不應該跨 fork 共用，
+    每個 worker 會在第一次聊天時自己建立。
 
-def parse_pdf_with_regex(file_path: str) -> Tuple[list, dict]: 
-    """
-    開啟 PDF，逐行讀取文字，解析「學生資訊」和「課程列表」。
-    
-    Returns:
-        (all_courses, student_info)
+    pdfplumber 只有在關閉解析沙盒 (PARSE_SANDBOX=0，直接在 Flask 行程解析) 時才預熱；
+    平常 PDF 都在 spawn 出來的沙盒 worker 裡解析，由 worker 自己載入 (見 parse_sandbox._init_worker)，
+    在 master 預先載入只會讓每個 Flask worker 多佔記憶體。
     """
-    
-    print(f"--- (1/3)  正在使用 Regex (規則配對) 讀取: {file_path} ---")
-    
-    all_courses = []
-    student_info = {
-        "year": None,
-        "id": None,
-        "name": None,
-        "department": None
-    }
-    
-    # --- ↓↓↓ (Bug 修正) 將 'found_student_info' 拆分 ---
-    found_year = False
-    found_student = False
-    # --- ↑↑↑ 修正結束 ↑↑↑ ---
+    import groq  # noqa: F401  (只載入模組，不建立客戶端)
+    if not parse_executor.enabled:
+        get_pdfplumber()
 
-    try:
-        with pdfplumber.open(file_path) as pdf:
-            print(f"檔案總頁數: {len(pdf.pages)}")
-            
-            for i, page in enumerate(pdf.pages):
-                
-                # (效能修正) 使用 layout=True 強制 pdfplumber 進行排版
-                text = page.extract_text(layout=True) 
-                
-                if not text:
-                    continue
-                
-                for line in text.split('\n'):
-                    line_stripped = line.strip()
-                    
-                    # (新) 嘗試匹配學生資訊 (只在第一頁且尚未找到時)
-                    if i == 0:
-                        # --- ↓↓↓ (Bug 修正) 獨立判斷 ---
-                        if not found_year:
-                            year_match = YEAR_PATTERN.search(line_stripped)
-                            if year_match:
-                                student_info["year"] = year_match.group(1)
-                                found_year = True # 標記已找到
-                                
-                        if not found_student:
-                            student_match = STUDENT_PATTERN.search(line_stripped)
-                            if student_match:
-                                student_info["id"] = student_match.group(1)
-                                student_info["name"] = student_match.group(2)
-                                student_info["department"] = student_match.group(3).strip()
-                                found_student = True # 標記已找到
-                        # --- ↑↑↑ 修正結束 ↑↑↑ ---
-                    
-                    # 嘗試匹配課程
-                    course_match = COURSE_PATTERN.match(line_stripped)
-                    if course_match:
-                        course_raw = course_match.groupdict()
-                        course = {} 
-                        
-                        course['系所'] = course_raw['系所']
-                        course['課號'] = course_raw['課號']
-                        
-                        if course_raw['期_full']:
-                            course['冊'] = course_raw['冊_full']
-                            course['學年'] = course_raw['學年_full']
-                            course['期'] = course_raw['期_full']
-                        else:
-                            course['冊'] = None
-                            course['學年'] = None
-                            course['期'] = course_raw['期_only']
-                        
-                        course['課名'] = course_raw['課名']
-                        course['選別'] = course_raw['選別']
-                        course['得分'] = course_raw['得分']
-                        course['學分'] = course_raw['學分']
-                        course['累計'] = course_raw['累計']
-                        course['分數'] = course_raw['分數']
-                        course['說明'] = course_raw['說明']
-
-                        for key, value in course.items():
-                            if value == "" or value is None:
-                                course[key] = None
-                        
-                        all_courses.append(course)
 
-        if not all_courses:
-            print("[警告] 成功開啟 PDF，但 Regex 未能匹配到任何課程資料。")
-            return [], student_info
-            
-        print(f"Regex 配對成功，共擷取 {len(all_courses)} 筆課程資料。")
-        print(f"學生資訊: {student_info}")
-        
-        return all_courses, student_info
-        
-    except FileNotFoundError:
-        print(f"[錯誤] 找不到檔案: {file_path}")
-        return [], {}
-    except Exception as e:
-        print(f"[錯誤] 讀取或解析 PDF 時發生意外: {e}")
-        return [], {}
+# === PDF 解析 (Regex / 切詞器) 獨立在 pdf_parser.py，解析沙盒的 worker 只載入它 ===
+from pdf_parser import get_pdfplumber
+
+# === 匯入 PDF 解析沙盒 (獨立行程 + 資源上限) ===
+from parse_sandbox import ParseExecutor, ParseError, ParseLimitError
+
+# === 匯入剛剛寫好的資料庫模組 ===
+from save_to_db import save_student_data,get_student_data_from_db, check_user_exists, get_transcript_version
+from save_to_db import (
+    get_course_pass_rates, get_credit_gap_distribution, get_at_risk_summary,
+    rebuild_course_stats_rollup, save_audit_rollup, list_student_ids
+)
 
 # ======================================================================
 # 
@@ -165,33 +83,102 @@ def parse_pdf_with_regex(file_path: str) -> Tuple[list, dict]:
 # 
 # ======================================================================
 
-def calculate_graduation_audit(all_courses: list) -> Tuple[dict, dict]:
+def current_academic_year(today=None) -> int:
+    """
+    目前的學年度 (民國)。學年度從 8 月開始，所以 1~7 月仍屬於前一個學年度，
+    例如 2027 年 3 月是 115-2 學期 -> 115。
+    """
+    today = today or datetime.date.today()
+    return (today.year - 1911) - (1 if today.month < 8 else 0)
+
+
+def classify_course_category(course_type) -> str:
+    """依「選別」決定課程歸屬的審查類別 (審查與修課規劃共用)。"""
+    if course_type and ("共必" in course_type or "共同必修" in course_type):
+        return "共同必修"
+    elif course_type and "通識" in course_type:
+        return "通識"
+    elif course_type and "院必修" in course_type:
+        return "院必修"
+    elif course_type and "選" in course_type: 
+        return "選修"
+    elif course_type and "系必" in course_type: 
+        return "必修"
+    return "其他" # 預設
+
+
+def common_requirement_keys(course_code: str, course_name: str) -> list:
+    """
+    共同必修 3 大規則：回傳這門課計入哪些細項 (English / Chinese / Service)。
+    """
+    keys = []
+    # 規則 1: 英語 (10學分) -> 課號 LC 或 EL 開頭
+    if course_code.startswith('LC') or course_code.startswith('EL'):
+        keys.append('English')
+    # 規則 2: 國文 (4學分) -> 課號 CL 開頭
+    elif course_code.startswith('CL'):
+        keys.append('Chinese')
+    # 規則 3: 服務學習 (1學分) -> 課名包含 "服務"
+    if "服務" in course_name:
+        keys.append('Service')
+    return keys
+
+
+def match_core_prefix(course_code: str, core_prefixes):
+    """通識核心：回傳課號符合的核心領域前綴，沒有則回傳 None。"""
+    for prefix in core_prefixes:
+        if course_code.startswith(prefix):
+            return prefix
+    return None
+
+
+def format_course_display(course_id, course_name, credits=None) -> str:
+    """課程顯示字串：「[課號: IM1001] 基礎程式設計 - 3 學分」(未通過的課不帶學分)。"""
+    display = f"[課號: {course_id}] {course_name}"
+    if credits is not None:
+        display += f" - {credits} 學分"
+    return display
+
+
+def build_course_columns(records: list, with_credits: bool) -> dict:
+    """(效能) 把 (課號, 課名, 學分) 紀錄轉成 ids / names (/ credits) 平行陣列 (精簡版回應用)。"""
+    columns = {"ids": [r[0] for r in records], "names": [r[1] for r in records]}
+    if with_credits:
+        columns["credits"] = [r[2] for r in records]
+    return columns
+
+
+def calculate_graduation_audit(all_courses: list, compact: bool = False) -> Tuple[dict, dict]:
     """
     讀取課程列表 (list)，計算學分 (已處理重修邏輯)，
     並「回傳」審查結果字典 (audit_categories) 和總計字典 (totals)。
+
+    (效能) compact=True 時各類別的課程清單改成 earned / failed 平行陣列
+    (ids / names / credits)，取代 earned_courses / failed_courses 顯示字串。
+    兩種格式都由審查過程中記下的 (課號, 課名, 學分) 產生。
     """
     
     print(f"--- (2/3) 正在讀取 {len(all_courses)} 筆課程資料進行審查 ---")
     
     # --- 1. 建立一個更詳細的資料結構 ---
     audit_categories = {
-        "必修":     {"goal": 70, "earned_sum": 0, "earned_courses": [], "failed_courses": []},
-        "院必修":   {"goal": 4,  "earned_sum": 0, "earned_courses": [], "failed_courses": []},
-        "選修":     {"goal": 27, "earned_sum": 0, "earned_courses": [], "failed_courses": []},
+        "必修":     {"goal": 70, "earned_sum": 0},
+        "院必修":   {"goal": 4,  "earned_sum": 0},
+        "選修":     {"goal": 27, "earned_sum": 0},
         "通識": {
             "goal": 12, 
             "earned_sum": 0, 
-            "earned_courses": [],
-            "failed_courses": [], 
             "core_required_prefixes": {"LS", "LE", "ID", "GN", "GS"},
             "core_passed_prefixes": set(),
             "core_missing_prefixes": [], 
             "core_passed_count": 0,
             "is_core_complete": False 
         },
-        "共同必修": {"goal": 15, "earned_sum": 0, "earned_courses": [], "failed_courses": []},
-        "其他":     {"goal": 0,  "earned_sum": 0, "earned_courses": [], "failed_courses": []},
+        "共同必修": {"goal": 15, "earned_sum": 0},
+        "其他":     {"goal": 0,  "earned_sum": 0},
     }
+    # (新) 各類別的已通過 / 未通過課程，記成 (課號, 課名, 學分)，最後再轉成回應格式
+    course_records = {key: {"earned": [], "failed": []} for key in audit_categories}
     # --- 1.1: 建立共同必修四大規則追蹤 ---
     common_req_status = {
         'English': {'name': '英語', 'goal': 10, 'earned': 0},
@@ -220,24 +207,12 @@ def calculate_graduation_audit(all_courses: list) -> Tuple[dict, dict]:
     # --- 2. 遍歷所有課程並計算 (第二階段) ---
     for course in all_courses:
         
-        course_display_name = f"[課號: {course.get('課號')}] {course.get('課名')}"
         course_code = str(course.get('課號', '')).upper().strip()
         course_name = str(course.get('課名', ''))
         course_type = course.get("選別")
         score = course.get("得分")
 
-        category_key = "其他" # 預設
-        
-        if course_type and ("共必" in course_type or "共同必修" in course_type):
-            category_key = "共同必修"
-        elif course_type and "通識" in course_type:
-            category_key = "通識"
-        elif course_type and "院必修" in course_type:
-            category_key = "院必修"
-        elif course_type and "選" in course_type: 
-            category_key = "選修"
-        elif course_type and "系必" in course_type: 
-            category_key = "必修"
+        category_key = classify_course_category(course_type)
 
         if score == "通過":
             # ★ 修正點：防止重複計算相同課號的學分 (例如重修刷分)
@@ -250,10 +225,9 @@ def calculate_graduation_audit(all_courses: list) -> Tuple[dict, dict]:
                 credits = 0.0
             
             display_credits = int(credits) if credits.is_integer() else credits
-            course_display_passed = f"{course_display_name} - {display_credits} 學分"
             
             audit_categories[category_key]["earned_sum"] += credits
-            audit_categories[category_key]["earned_courses"].append(course_display_passed)
+            course_records[category_key]["earned"].append((course.get('課號'), course.get('課名'), display_credits))
             total_earned_credits += credits # (新) 累加總學分
 
             # 標記這門課已經算過分了
@@ -264,23 +238,13 @@ def calculate_graduation_audit(all_courses: list) -> Tuple[dict, dict]:
             # ★ 核心修改：共同必修 4 大規則判斷
             # ==========================================
             
-            # 規則 1: 英語 (10學分) -> 課號 LC 或 EL 開頭
-            if course_code.startswith('LC') or course_code.startswith('EL'):
-                common_req_status['English']['earned'] += credits
-            
-            # 規則 2: 國文 (4學分) -> 課號 CL 開頭
-            elif course_code.startswith('CL'):
-                common_req_status['Chinese']['earned'] += credits
-            
-            # 規則 3: 服務學習 (1學分) -> 課名包含 "服務"
-            if "服務" in course_name:
-                common_req_status['Service']['earned'] += credits
+            for req_key in common_requirement_keys(course_code, course_name):
+                common_req_status[req_key]['earned'] += credits
             # ==========================================
             if category_key == "通識" and course_code:
-                for prefix in audit_categories["通識"]["core_required_prefixes"]:
-                    if course_code.startswith(prefix):
-                        audit_categories["通識"]["core_passed_prefixes"].add(prefix)
-                        break
+                prefix = match_core_prefix(course_code, audit_categories["通識"]["core_required_prefixes"])
+                if prefix:
+                    audit_categories["通識"]["core_passed_prefixes"].add(prefix)
                         
         elif score == "未過":
             # --- (新) 檢查重修 & 重複被當 邏輯 ---
@@ -295,13 +259,22 @@ def calculate_graduation_audit(all_courses: list) -> Tuple[dict, dict]:
 
             # --- (新) 符合條件：加入列表並標記 ---
             # 如果 1 和 2 都通過了 (代表這門課「從未通過」且「尚未被記錄」)
-            audit_categories[category_key]["failed_courses"].append(course_display_name)
+            course_records[category_key]["failed"].append((course.get('課號'), course.get('課名'), None))
             
             # 標記此課號已加入「未通過」列表
             if course_code:
                 failed_course_ids_added.add(course_code)
             # --- 邏輯結束 ---
             
+    # --- 2.5 (新) 課程清單：完整版為顯示字串，精簡版為平行陣列 ---
+    for category_key, records in course_records.items():
+        if compact:
+            audit_categories[category_key]["earned"] = build_course_columns(records["earned"], with_credits=True)
+            audit_categories[category_key]["failed"] = build_course_columns(records["failed"], with_credits=False)
+        else:
+            audit_categories[category_key]["earned_courses"] = [format_course_display(*r) for r in records["earned"]]
+            audit_categories[category_key]["failed_courses"] = [format_course_display(*r) for r in records["failed"]]
+
     # --- 3. 結算「通識」核心 ---
     gen_ed = audit_categories["通識"]
     gen_ed["core_passed_count"] = len(gen_ed["core_passed_prefixes"])
@@ -332,6 +305,226 @@ def calculate_graduation_audit(all_courses: list) -> Tuple[dict, dict]:
     print("--- (2/3 - B) JSON 序列化準備完成 ---")
     return audit_categories, totals
 
+def build_audit_summary(audit_results: dict, totals: dict) -> dict:
+    """
+    (新) 把審查結果濃縮成學系分析彙總表 (STUDENT_AUDIT_ROLLUP) 需要的數字。
+    key 對應 save_to_db.AUDIT_ROLLUP_COLUMNS。
+    """
+    common = audit_results.get("共同必修", {})
+    gen_ed = audit_results.get("通識", {})
+    common_detail = audit_results.get("Common_Requirements_Detail", {})
+
+    def gap(data):
+        return max(0, data.get("goal", 0) - data.get("earned_sum", 0))
+
+    return {
+        "TotalEarned": totals.get("total_earned", 0),
+        "TotalRequired": totals.get("total_required", 0),
+        "CommonEarned": common.get("earned_sum", 0),
+        "CommonGap": gap(common),
+        "EnglishGap": common_detail.get("English", {}).get("gap", 0),
+        "ChineseGap": common_detail.get("Chinese", {}).get("gap", 0),
+        "ServiceGap": common_detail.get("Service", {}).get("gap", 0),
+        "GenEdEarned": gen_ed.get("earned_sum", 0),
+        "GenEdGap": gap(gen_ed),
+        "GenEdCoreMissing": len(gen_ed.get("core_missing_prefixes", [])),
+        "FailedRequiredCount": len(audit_results.get("必修", {}).get("failed_courses", [])),
+    }
+
+# ======================================================================
+# 
+#                           PART 2.6: 修課規劃模擬 (What-if)
+# 
+# ======================================================================
+# 「如果下學期修 X、Y、Z，能不能畢業？」
+# 先對學生現有成績跑一次 calculate_graduation_audit，把結果濃縮成「規劃狀態」，
+# 之後每個假設的修課組合只計算這幾門課帶來的增量，不必重跑整份審查。
+
+PLAN_CATEGORIES = ("必修", "院必修", "選修", "通識", "共同必修") # 有畢業門檻的類別
+MAX_PLANS_PER_REQUEST = 500
+MAX_COURSES_PER_PLAN = 40
+MAX_CANDIDATES = 500 # suggest_min_plan 每挑一門課都會掃過全部候選，上限約 40 x 500 次增量計算
+
+
+def build_plan_state(all_courses: list) -> dict:
+    """
+    對現有成績跑一次完整審查，整理成修課規劃用的狀態：
+    各類別已得學分 / 門檻、共同必修細項、通識核心缺漏、已通過課號、待補修必修。
+    """
+    audit_results, totals = calculate_graduation_audit(all_courses, compact=True)
+    common_detail = audit_results["Common_Requirements_Detail"]
+    gen_ed = audit_results["通識"]
+
+    # 沒有課號的未過紀錄無法對應到補修的課，略過
+    failed_required = {
+        str(course_id).upper().strip() for course_id in audit_results["必修"]["failed"]["ids"] if course_id
+    }
+
+    return {
+        "category_earned": {k: audit_results[k]["earned_sum"] for k in PLAN_CATEGORIES},
+        "category_goal": {k: audit_results[k]["goal"] for k in PLAN_CATEGORIES},
+        "common_earned": {k: v["earned"] for k, v in common_detail.items()},
+        "common_goal": {k: v["goal"] for k, v in common_detail.items()},
+        "core_required": set(gen_ed["core_required_prefixes"]),
+        "core_missing": set(gen_ed["core_missing_prefixes"]),
+        "passed_codes": {
+            str(c.get('課號', '')).upper().strip() for c in all_courses if c.get("得分") == "通過"
+        },
+        "failed_required": failed_required,
+        "total_earned": totals["total_earned"],
+        "total_required": totals["total_required"],
+    }
+
+
+def plan_course_delta(state: dict, course: dict) -> dict:
+    """
+    計算一門「假設會通過」的課對規劃狀態的增量 (與 calculate_graduation_audit 規則相同)。
+    已經通過過的課號不會再加學分。
+    """
+    course_code = str(course.get('課號', '')).upper().strip()
+    course_name = str(course.get('課名', ''))
+    category_key = classify_course_category(course.get('選別'))
+    try:
+        credits = float(course.get('學分', 0))
+    except (ValueError, TypeError):
+        credits = 0.0
+
+    core_prefix = None
+    if category_key == "通識" and course_code:
+        core_prefix = match_core_prefix(course_code, state["core_required"])
+
+    return {
+        "code": course_code,
+        "category": category_key,
+        "credits": credits,
+        "common_keys": common_requirement_keys(course_code, course_name),
+        "core_prefix": core_prefix,
+        "counts": course_code not in state["passed_codes"],
+    }
+
+
+def _new_plan_acc() -> dict:
+    """修課組合的累計增量 (各類別學分、共同必修細項、通識核心、已補修必修)。"""
+    return {
+        "category_add": {}, "common_add": {}, "core_added": set(),
+        "cleared_failed": set(), "seen": set(), "plan_credits": 0.0,
+    }
+
+
+def _add_plan_delta(state: dict, acc: dict, d: dict):
+    """把一門課的增量加進累計值 (計畫內重複的課號只計一次)。"""
+    if not d["counts"] or (d["code"] and d["code"] in acc["seen"]):
+        return
+    if d["code"]:
+        acc["seen"].add(d["code"])
+    acc["plan_credits"] += d["credits"]
+    acc["category_add"][d["category"]] = acc["category_add"].get(d["category"], 0) + d["credits"]
+    for key in d["common_keys"]:
+        acc["common_add"][key] = acc["common_add"].get(key, 0) + d["credits"]
+    if d["core_prefix"]:
+        acc["core_added"].add(d["core_prefix"])
+    if d["code"] in state["failed_required"]:
+        acc["cleared_failed"].add(d["code"])
+
+
+def _plan_result(state: dict, acc: dict) -> dict:
+    """由規劃狀態 + 累計增量算出剩餘缺額與是否達到畢業條件。"""
+    category_gaps = {
+        k: max(0, state["category_goal"][k] - state["category_earned"][k] - acc["category_add"].get(k, 0))
+        for k in PLAN_CATEGORIES
+    }
+    common_gaps = {
+        k: max(0, state["common_goal"][k] - state["common_earned"][k] - acc["common_add"].get(k, 0))
+        for k in state["common_goal"]
+    }
+    core_missing = sorted(state["core_missing"] - acc["core_added"])
+    failed_remaining = sorted(state["failed_required"] - acc["cleared_failed"])
+    total_gap = max(0, state["total_required"] - state["total_earned"] - acc["plan_credits"])
+
+    # 缺額分數：越小越接近畢業 (學分缺額 + 通識核心領域數 + 待補修必修門數)
+    gap_score = (
+        sum(category_gaps.values()) + sum(common_gaps.values()) + total_gap
+        + len(core_missing) + len(failed_remaining)
+    )
+    return {
+        "graduates": gap_score == 0,
+        "gap_score": gap_score,
+        "plan_credits": acc["plan_credits"],
+        "total_gap": total_gap,
+        "category_gaps": category_gaps,
+        "common_gaps": common_gaps,
+        "core_missing_prefixes": core_missing,
+        "failed_required_remaining": failed_remaining,
+    }
+
+
+def evaluate_plan(state: dict, deltas: list) -> dict:
+    """套用一組課程增量 (plan_course_delta 的結果)，回傳剩餘缺額與是否達到畢業條件。"""
+    acc = _new_plan_acc()
+    for d in deltas:
+        _add_plan_delta(state, acc, d)
+    return _plan_result(state, acc)
+
+
+def rank_plans(state: dict, plans: list) -> list:
+    """評估多個修課組合，依「能否畢業 -> 缺額分數 -> 學分數」排序。"""
+    results = []
+    for index, plan in enumerate(plans):
+        result = evaluate_plan(state, [plan_course_delta(state, c) for c in plan])
+        result["index"] = index
+        results.append(result)
+    results.sort(key=lambda r: (not r["graduates"], r["gap_score"], r["plan_credits"]))
+    return results
+
+
+def _plan_delta_gain(current: dict, acc: dict, d: dict) -> float:
+    """
+    再加一門課會讓缺額分數下降多少 (直接由目前缺額計算，不必重算整個組合)。
+    """
+    if not d["counts"] or (d["code"] and d["code"] in acc["seen"]):
+        return 0
+    credits = d["credits"]
+    gain = min(credits, current["total_gap"])
+    if d["category"] in current["category_gaps"]:
+        gain += min(credits, current["category_gaps"][d["category"]])
+    for key in d["common_keys"]:
+        gain += min(credits, current["common_gaps"].get(key, 0))
+    if d["core_prefix"] and d["core_prefix"] in current["core_missing_prefixes"]:
+        gain += 1
+    if d["code"] in current["failed_required_remaining"]:
+        gain += 1
+    return gain
+
+
+def suggest_min_plan(state: dict, candidates: list, max_courses: int = MAX_COURSES_PER_PLAN) -> dict:
+    """
+    (貪婪法) 從候選課程中一次挑一門「每學分能補最多缺額」的課，
+    直到所有缺額補齊或沒有候選課能再改善為止。
+    """
+    pool = [(c, plan_course_delta(state, c)) for c in candidates]
+    chosen = []
+    acc = _new_plan_acc()
+    current = _plan_result(state, acc)
+
+    while not current["graduates"] and len(chosen) < max_courses:
+        best = None
+        for i, (course, delta) in enumerate(pool):
+            gain = _plan_delta_gain(current, acc, delta)
+            if gain <= 0:
+                continue
+            efficiency = gain / max(delta["credits"], 1.0)
+            if best is None or efficiency > best[0]:
+                best = (efficiency, i)
+        if best is None:
+            break
+        course, delta = pool.pop(best[1])
+        _add_plan_delta(state, acc, delta)
+        current = _plan_result(state, acc)
+        chosen.append(course)
+
+    return {"courses": chosen, "result": current}
+
+
 # ======================================================================
 # 
 #                           PART 2.5: AI 建議生成 (新增功能)
@@ -345,7 +538,139 @@ def calculate_graduation_audit(all_courses: list) -> Tuple[dict, dict]:
 # ======================================================================
 
 app = Flask(__name__)
-CORS(app) # 允許所有來源的前端呼叫此 API
+CORS(app, expose_headers=["ETag"]) # 允許所有來源的前端呼叫此 API (並讓前端讀得到 ETag)
+
+
+# ==========================================
+#  PDF 解析沙盒設定 (可用環境變數調整)
+# ==========================================
+parse_executor = ParseExecutor(
+    max_workers=int(os.getenv("PARSE_MAX_WORKERS", 2)),
+    max_queue=int(os.getenv("PARSE_MAX_QUEUE", 4)),
+    job_timeout=float(os.getenv("PARSE_TIMEOUT_SEC", 30)),
+    max_pages=int(os.getenv("PARSE_MAX_PAGES", 50)),
+    max_bytes=int(os.getenv("PARSE_MAX_BYTES", 10 * 1024 * 1024)),
+    max_memory_mb=int(os.getenv("PARSE_MAX_MEMORY_MB", 1024)),
+    max_jobs_per_worker=int(os.getenv("PARSE_JOBS_PER_WORKER", 20)),
+    enabled=os.getenv("PARSE_SANDBOX", "1") != "0",
+)
+
+# 上傳大小上限 (Flask 會在讀取 request body 時直接回 413)，多留 64KB 給 multipart 表頭
+app.config['MAX_CONTENT_LENGTH'] = parse_executor.max_bytes + 64 * 1024
+
+
+@app.errorhandler(413)
+def handle_request_too_large(e):
+    return jsonify({"error": f"檔案太大，上限為 {parse_executor.max_bytes // (1024 * 1024)} MB"}), 413
+
+
+# ==========================================
+#  (新) 登入憑證：簽章過的 session token
+# ==========================================
+# /api/login 發給前端一個簽章 token，內含學號；
+# 之後的 API 只要驗證簽章 (純 CPU 運算，不查資料庫) 就知道是誰。
+# token 只代表身分、不帶成績單版本號：token 有效期長達數小時，期間其他裝置可能已上傳新成績單，
+# ETag / AI 回答快取用的版本號一律查 TRANSCRIPT_VERSION (一次主鍵查詢)。
+# 前端以 Authorization: Bearer <token> 傳送。過渡期間沒帶 token 的請求仍可用 body 的
+# student_id (SESSION_REQUIRED=1 時一律要求 token)。
+SESSION_SECRET_KEY = os.getenv("SESSION_SECRET_KEY")
+SESSION_TTL_SEC = int(os.getenv("SESSION_TTL_SEC", 12 * 3600))
+SESSION_REQUIRED = os.getenv("SESSION_REQUIRED", "0") == "1"
+
+if SESSION_SECRET_KEY:
+    session_serializer = URLSafeTimedSerializer(SESSION_SECRET_KEY, salt="student-session")
+elif SESSION_REQUIRED:
+    raise RuntimeError("SESSION_REQUIRED=1 時必須設定 SESSION_SECRET_KEY")
+else:
+    # 不能自己隨機產生金鑰：多個 gunicorn worker 各拿到不同的金鑰，
+    # A worker 發的 token 到了 B worker 就驗證失敗，前端會一直被登出。
+    # 沒設定時乾脆不發 token，全部走 body 的 student_id。
+    print("[警告] 未設定 SESSION_SECRET_KEY，不發放登入 token")
+    session_serializer = None
+
+
+def issue_session_token(student_id: str):
+    """簽發 token：{"sid": 學號}；未設定金鑰時回傳 None。"""
+    if session_serializer is None:
+        return None
+    return session_serializer.dumps({"sid": student_id})
+
+
+def read_session_token(token: str):
+    """驗證 token，成功回傳學號；簽章錯誤或過期回傳 None。"""
+    try:
+        payload = session_serializer.loads(token, max_age=SESSION_TTL_SEC)
+    except (SignatureExpired, BadSignature):
+        return None
+    return payload.get("sid")
+
+
+def resolve_request_student(data: dict):
+    """
+    找出這個請求代表哪位學生。
+    Returns:
+        (student_id, error)
+        - error: 驗證失敗時為 (JSON 回應, 狀態碼)，否則為 None
+    """
+    auth = request.headers.get('Authorization', '')
+    body_student_id = (data or {}).get('student_id')
+
+    if session_serializer is not None and auth.startswith('Bearer '):
+        student_id = read_session_token(auth[len('Bearer '):].strip())
+        if student_id is None:
+            return None, (jsonify({"error": "登入已過期，請重新登入"}), 401)
+        if body_student_id and body_student_id != student_id:
+            return None, (jsonify({"error": "學號與登入身分不符"}), 403)
+        return student_id, None
+
+    if SESSION_REQUIRED:
+        return None, (jsonify({"error": "請先登入"}), 401)
+    return body_student_id, None
+
+
+# ==========================================
+#  (效能) 大型 JSON 回應壓縮
+# ==========================================
+COMPRESS_MIN_BYTES = 1024 # 小於 1KB 的回應壓縮效益不大，直接送出
+COMPRESS_LEVEL = 6
+
+
+def choose_content_encoding(accept_encoding: str):
+    """依照 Accept-Encoding 選擇壓縮方式 (優先 br，其次 gzip)。"""
+    accepted = {part.split(';')[0].strip().lower() for part in accept_encoding.split(',')}
+    if brotli is not None and 'br' in accepted:
+        return 'br'
+    if 'gzip' in accepted:
+        return 'gzip'
+    return None
+
+
+@app.after_request
+def compress_json_response(response):
+    """把夠大的 JSON 回應用 br / gzip 壓縮，手機等慢速網路可以少傳很多資料。"""
+    if (response.status_code != 200
+            or response.direct_passthrough
+            or response.mimetype != 'application/json'
+            or 'Content-Encoding' in response.headers):
+        return response
+
+    response.vary.add('Accept-Encoding')
+    encoding = choose_content_encoding(request.headers.get('Accept-Encoding', ''))
+    if encoding is None:
+        return response
+
+    body = response.get_data()
+    if len(body) < COMPRESS_MIN_BYTES:
+        return response
+
+    if encoding == 'br':
+        body = brotli.compress(body, quality=5)
+    else:
+        body = gzip.compress(body, compresslevel=COMPRESS_LEVEL)
+
+    response.set_data(body)
+    response.headers['Content-Encoding'] = encoding
+    return response
 
 
 # ==========================================
@@ -387,9 +712,12 @@ def handle_login():
         
         if user_info:
             # A. 老朋友：資料庫有資料
+            version = get_transcript_version(student_id)
             return jsonify({
                 "success": True, 
-                "user": user_info
+                "user": user_info,
+                "token": issue_session_token(student_id),
+                "transcript_version": version
             })
         else:
             # B. 新朋友/轉系生：資料庫沒資料
@@ -401,7 +729,9 @@ def handle_login():
                     "id": student_id,
                     "name": "新同學",       # 暫時的稱呼
                     "department": "尚未驗證" # 暫時的系所
-                }
+                },
+                "token": issue_session_token(student_id),
+                "transcript_version": 0
             })
             
     except Exception as e:
@@ -426,6 +756,11 @@ def handle_pdf_upload():
     if file.filename == '':
         return jsonify({"error": "未選擇檔案"}), 400
 
+    # (新) 有帶 token 時先驗證 (過期 / 偽造的 token 不進入解析)
+    session_student_id, error = resolve_request_student({})
+    if error:
+        return error
+
     if file and file.filename.endswith('.pdf'):
         try:
             # 2. 建立一個「暫存」的 PDF 檔案
@@ -435,8 +770,8 @@ def handle_pdf_upload():
             
             print(f"檔案已暫存於: {temp_pdf_path}")
 
-            # 3. 呼叫 PDF 解析
-            all_courses, student_info = parse_pdf_with_regex(temp_pdf_path) # (新) 接收學生資訊
+            # 3. 呼叫 PDF 解析 (在沙盒行程中執行，有逾時 / 記憶體 / 頁數上限)
+            all_courses, student_info = parse_executor.parse(temp_pdf_path) # (新) 接收學生資訊
             
             # =============== ↓↓↓ 您要求的新增程式碼 (儲存 JSON) ===============
             if all_courses: # 確保有抓到資料再儲存
@@ -467,19 +802,30 @@ def handle_pdf_upload():
                  # 清理暫存檔
                 os.remove(temp_pdf_path)
                 return jsonify({"error": "解析 PDF 失敗，或 Regex 未匹配到任何課程。"}), 500
+
+            # (新) 有登入身分時只能上傳自己的成績單 (SESSION_REQUIRED=1 時一定有身分)，
+            # 與 /api/chat、/api/student/data 相同回 403，不寫入資料庫
+            if session_student_id and student_info.get('id') != session_student_id:
+                os.remove(temp_pdf_path)
+                return jsonify({"error": "成績單學號與登入身分不符"}), 403
             
-            # 3. 寫入資料庫 (呼叫外部 save_to_db 模組)
+            # 3. 呼叫畢業審查 (先算好，存檔時一併更新學系分析彙總表)
+            audit_results, totals = calculate_graduation_audit(all_courses) # (新) 接收總計
+
+            # 4. 寫入資料庫 (呼叫外部 save_to_db 模組)
             # 這是我們新加入的步驟，取代原本的 JSON 寫入
             if student_info.get('id'):
                 print(f"--- (2/4) 正在呼叫資料庫存檔模組... ---")
-                save_success = save_student_data(student_info, all_courses)
+                audit_summary = build_audit_summary(audit_results, totals)
+                save_success = save_student_data(student_info, all_courses, audit_summary)
                 if not save_success:
                     print("[警告] 資料庫寫入失敗，但流程將繼續進行畢業審查。")
+                else:
+                    # 版本號已變，舊的 AI 回答不會再被命中，這裡順便釋放記憶體
+                    chat_answer_cache.invalidate_student(student_info['id'])
             else:
                 print("[警告] 無法取得學號，跳過資料庫存檔步驟。")
-                
-            # 4. 呼叫畢業審查
-            audit_results, totals = calculate_graduation_audit(all_courses) # (新) 接收總計
+                save_success = False
        
             
             # 5. 清理暫存檔
@@ -488,12 +834,25 @@ def handle_pdf_upload():
             print("--- (3/3) 成功，準備回傳 JSON 給前端 ---")
             
             # 6. 將抓到的課程資料 (JSON) 回傳給前端
-            return jsonify({
+            response = {
                 "message": f"成功解析 {len(all_courses)} 筆課程",
                 "audit_report": audit_results,
                 "student_info": student_info, # (新)
                 "totals": totals # (新)
-            })
+            }
+            # (新) 回傳新的成績單版本號
+            if save_success:
+                response["transcript_version"] = get_transcript_version(student_info['id'])
+            return jsonify(response)
+
+        except ParseError as e:
+            # (新) 解析沙盒的資源限制：檔案太大 -> 413，忙碌 / 逾時 -> 503
+            if 'temp_pdf_path' in locals() and os.path.exists(temp_pdf_path):
+                os.remove(temp_pdf_path)
+            print(f"[解析限制] {e}")
+            if isinstance(e, ParseLimitError):
+                return jsonify({"error": f"PDF 超過解析限制: {e}"}), 413
+            return jsonify({"error": f"伺服器忙碌中，請稍後再試 ({e})"}), 503, {"Retry-After": "5"}
 
         except Exception as e:
             # (清理暫存檔 - 以防万一)
@@ -517,16 +876,147 @@ def handle_pdf_upload():
 
 
 
+# 呼叫 Groq 的模型參數 (同時也是回答快取 key 的一部分，改參數會自動錯開舊答案)
+CHAT_MODEL_PARAMS = {
+    "model": "openai/gpt-oss-120b",
+    "temperature": 0.7,
+    "max_completion_tokens": 8192, # 稍微增加長度以容納解釋
+}
+
+# ==========================================
+#  (效能) AI 回答快取
+# ==========================================
+# key = (學號, 成績單版本號, 正規化後的問題, 模型參數)
+# - 重新上傳成績單後版本號會 +1，舊答案自然不會再被命中 (上傳時也會主動清掉)
+# - 超過 CHAT_CACHE_MAX_ENTRIES 筆時淘汰最久沒用到的 (LRU)，超過 CHAT_CACHE_TTL_SEC 秒的視為過期
+# - 每個 worker 行程各自一份，不需要額外的快取伺服器
+CHAT_CACHE_ENABLED = os.getenv("CHAT_CACHE_ENABLED", "1") != "0"
+CHAT_CACHE_MAX_ENTRIES = int(os.getenv("CHAT_CACHE_MAX_ENTRIES", "1000"))
+CHAT_CACHE_TTL_SEC = int(os.getenv("CHAT_CACHE_TTL_SEC", "3600"))
+CHAT_QUESTION_STRIP = " \t\r\n?？!！.。,，~～…"
+
+
+def normalize_chat_question(message: str) -> str:
+    """
+    問題正規化：全形轉半形、英文轉小寫、去掉空白與頭尾標點。
+    例如「我還差多少 學分？」與「我還差多少學分」會得到相同的 key。
+    """
+    text = unicodedata.normalize("NFKC", message).casefold()
+    text = "".join(text.split())
+    return text.strip(CHAT_QUESTION_STRIP)
+
+
+class ChatAnswerCache:
+    """有大小上限 (LRU) 與存活時間的 AI 回答快取，附命中率統計。"""
+
+    def __init__(self, max_entries: int, ttl_sec: float):
+        self.max_entries = max_entries
+        self.ttl_sec = ttl_sec
+        self._entries = OrderedDict() # key -> (存入時間, 回答)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.bypassed = 0
+        self.evicted_size = 0
+        self.evicted_age = 0
+
+    @staticmethod
+    def make_key(student_id: str, version: int, message: str) -> tuple:
+        return (student_id, version, normalize_chat_question(message),
+                tuple(sorted(CHAT_MODEL_PARAMS.items())))
+
+    def get(self, key):
+        """命中回傳回答字串，否則回傳 None。"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            stored_at, reply = entry
+            if time.monotonic() - stored_at > self.ttl_sec:
+                del self._entries[key]
+                self.evicted_age += 1
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return reply
+
+    def put(self, key, reply: str):
+        with self._lock:
+            self._entries[key] = (time.monotonic(), reply)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evicted_size += 1
+
+    def record_bypass(self):
+        with self._lock:
+            self.bypassed += 1
+
+    def invalidate_student(self, student_id: str) -> int:
+        """刪除某位學生的所有快取答案 (例如重新上傳成績單後)，回傳刪除筆數。"""
+        with self._lock:
+            stale = [key for key in self._entries if key[0] == student_id]
+            for key in stale:
+                del self._entries[key]
+        return len(stale)
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "enabled": CHAT_CACHE_ENABLED,
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "ttl_sec": self.ttl_sec,
+                "hits": self.hits,
+                "misses": self.misses,
+                "bypassed": self.bypassed,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else None,
+                "evicted_size": self.evicted_size,
+                "evicted_age": self.evicted_age,
+            }
+
+
+chat_answer_cache = ChatAnswerCache(CHAT_CACHE_MAX_ENTRIES, CHAT_CACHE_TTL_SEC)
+
+
+@app.route("/api/chat/cache-stats", methods=["GET"])
+def chat_cache_stats():
+    """(監控用) AI 回答快取的命中率與淘汰統計。"""
+    return jsonify(chat_answer_cache.stats())
+
+
 @app.route("/api/chat", methods=["POST"])
 def handle_chat():
     try:
         data = request.json
         user_message = data.get('message', '')
-        student_id = data.get('student_id')
+        student_id, error = resolve_request_student(data)
+        if error:
+            return error
 
         if not user_message:
             return jsonify({"reply": "請輸入問題"}), 400
 
+        # 0. (效能) 先查回答快取：命中就不必讀資料庫、跑審查、呼叫 Groq
+        #    前端送 "no_cache": true 或 Cache-Control: no-cache 時略過快取 (仍會存入新答案)
+        #    版本號一律查資料庫 (主鍵查詢)：其他 worker 處理的上傳不會清掉這個行程的快取，
+        #    只能靠版本號讓舊答案失效
+        cache_key = None
+        if CHAT_CACHE_ENABLED:
+            version = get_transcript_version(student_id)
+            if version is not None:
+                cache_key = ChatAnswerCache.make_key(student_id, version, user_message)
+                bypass = data.get('no_cache') or 'no-cache' in request.headers.get('Cache-Control', '')
+                if bypass:
+                    chat_answer_cache.record_bypass()
+                else:
+                    cached_reply = chat_answer_cache.get(cache_key)
+                    if cached_reply is not None:
+                        return jsonify({"reply": cached_reply, "cached": True})
+
         # 1. 從資料庫撈取資料
         db_student_info, db_courses = get_student_data_from_db(student_id)
         if not db_student_info:
@@ -604,8 +1094,7 @@ def handle_chat():
         missing_core = ", ".join(gen_ed.get('core_missing_prefixes', [])) if not gen_ed.get('is_core_complete') else "已完成"
 
         # === 建議：先在 Python 算好年級，不要讓 AI 算 ===
-        import datetime
-        current_ro_year = datetime.datetime.now().year - 1911
+        current_ro_year = current_academic_year()
         try:
             enroll_year = int(db_student_info.get('year', 0))
             grade_level = current_ro_year - enroll_year + 1
@@ -649,23 +1138,45 @@ def handle_chat():
         """
 
         # 3. 呼叫 Groq
-        completion = client.chat.completions.create(
-            model="openai/gpt-oss-120b",
+        completion = get_llm_client().chat.completions.create(
             messages=[
                 {"role": "system", "content": system_context},
                 {"role": "user", "content": user_message}
             ],
-            temperature=0.7,
-            max_completion_tokens=8192, # 稍微增加長度以容納解釋
-            stream=False
+            stream=False,
+            **CHAT_MODEL_PARAMS
         )
+        reply = completion.choices[0].message.content
+
+        if cache_key is not None and reply:
+            chat_answer_cache.put(cache_key, reply)
         
-        return jsonify({"reply": completion.choices[0].message.content})
+        return jsonify({"reply": reply, "cached": False})
 
     except Exception as e:
         print(f"Chat Error: {e}")
         return jsonify({"reply": "AI 暫時無法回應，請稍後再試。"}), 500
     
+def make_student_data_etag(student_id, version, compact: bool) -> str:
+    """
+    ETag = 學號 + 成績單版本號 + 回應格式；版本號沒變，儀表板資料就沒變。
+    同一個 ETag 會用在 br / gzip / 未壓縮三種回應本文上，位元組不同，所以標成弱 ETag (W/)。
+    """
+    shape = "compact" if compact else "full"
+    return f'W/"{student_id}-v{version}-{shape}"'
+
+
+def etag_matches(etag: str, if_none_match: str) -> bool:
+    """If-None-Match 是以逗號分隔的 ETag 清單 (或 *)，逐一做弱比對 (忽略 W/ 前綴)。"""
+    if not if_none_match:
+        return False
+    candidates = [tag.strip() for tag in if_none_match.split(',')]
+    if '*' in candidates:
+        return True
+    opaque = etag[2:] if etag.startswith('W/') else etag
+    return any((tag[2:] if tag.startswith('W/') else tag) == opaque for tag in candidates)
+
+
 # ==========================================================
 #  (新增) 獲取學生完整資料 API (用於登入後自動載入)
 # ==========================================================
@@ -673,11 +1184,25 @@ def handle_chat():
 def get_student_full_data():
     try:
         data = request.json
-        student_id = data.get('student_id')
+        student_id, error = resolve_request_student(data)
+        if error:
+            return error
+        # (效能) compact=true 時回傳精簡格式 (課程清單改為平行陣列)
+        compact = bool(data.get('compact') or request.args.get('shape') == 'compact')
         
         if not student_id:
             return jsonify({"error": "缺少學號"}), 400
 
+        # 0. (效能) 條件式請求：用成績單版本號當 ETag，沒變就直接回 304
+        #    (只查 TRANSCRIPT_VERSION 一列，不讀成績單、不跑審查)
+        version = get_transcript_version(student_id)
+        etag = make_student_data_etag(student_id, version, compact) if version is not None else None
+        if etag and etag_matches(etag, request.headers.get('If-None-Match', '')):
+            response = app.response_class(status=304)
+            response.headers['ETag'] = etag
+            response.headers['Cache-Control'] = 'private, no-cache'
+            return response
+
         # 1. 從資料庫撈取資料 (使用現有的函式)
         db_student_info, db_courses = get_student_data_from_db(student_id)
         
@@ -689,22 +1214,120 @@ def get_student_full_data():
             })
 
         # 2. 進行畢業審查計算 (使用現有的函式)
-        audit_results, totals = calculate_graduation_audit(db_courses)
+        audit_results, totals = calculate_graduation_audit(db_courses, compact=compact)
 
         # 3. 回傳跟上傳 PDF 時完全一樣的 JSON 結構
-        return jsonify({
+        response = jsonify({
             "found": True,
             "message": "成功載入舊資料",
             "student_info": db_student_info,
             "audit_report": audit_results,
-            "totals": totals
+            "totals": totals,
+            "transcript_version": version
         })
+        if etag:
+            response.headers['ETag'] = etag
+            response.headers['Cache-Control'] = 'private, no-cache'
+        return response
 
     except Exception as e:
         print(f"Fetch Data Error: {e}")
         return jsonify({"error": "系統錯誤"}), 500
     
 
+# ==========================================================
+#  (新增) 修課規劃模擬 API
+# ==========================================================
+@app.route("/api/plan", methods=["POST"])
+def handle_plan():
+    """
+    Request JSON:
+        student_id: 學號
+        plans:      [[課程, ...], ...]  要比較的修課組合 (選填)
+        candidates: [課程, ...]         候選課程，會建議補齊缺額的最少組合 (選填)
+    課程格式與解析結果相同：{"課號", "課名", "選別", "學分"}，一律假設會通過。
+    """
+    try:
+        data = request.json
+        student_id, error = resolve_request_student(data)
+        if error:
+            return error
+        plans = data.get('plans') or []
+        candidates = data.get('candidates') or []
+
+        if not student_id:
+            return jsonify({"error": "缺少學號"}), 400
+        if len(plans) > MAX_PLANS_PER_REQUEST or any(len(p) > MAX_COURSES_PER_PLAN for p in plans):
+            return jsonify({"error": f"最多 {MAX_PLANS_PER_REQUEST} 個組合，每個組合最多 {MAX_COURSES_PER_PLAN} 門課"}), 400
+        if len(candidates) > MAX_CANDIDATES:
+            return jsonify({"error": f"候選課程最多 {MAX_CANDIDATES} 門"}), 400
+
+        db_student_info, db_courses = get_student_data_from_db(student_id)
+        if not db_student_info:
+            return jsonify({"error": "找不到資料"}), 404
+
+        # 只跑一次完整審查，之後每個組合都是增量計算
+        state = build_plan_state(db_courses)
+        response = {
+            "baseline": evaluate_plan(state, []),
+            "plans": rank_plans(state, plans),
+        }
+        if candidates:
+            response["suggestion"] = suggest_min_plan(state, candidates)
+        return jsonify(response)
+
+    except Exception as e:
+        print(f"Plan API Error: {e}")
+        return jsonify({"error": "系統錯誤"}), 500
+
+
+# ==========================================================
+#  (新增) 學系分析 API (給導師使用，只查預先彙總表)
+# ==========================================================
+@app.route("/api/analytics/courses", methods=["GET"])
+def analytics_course_pass_rates():
+    """各課程通過 / 未過率。?min_attempts=N 可過濾修課人次太少的課。"""
+    min_attempts = request.args.get('min_attempts', 1, type=int)
+    results = get_course_pass_rates(min_attempts)
+    if results is None:
+        return jsonify({"error": "系統錯誤"}), 500
+    return jsonify({"courses": results})
+
+
+@app.route("/api/analytics/credit-gaps", methods=["GET"])
+def analytics_credit_gaps():
+    """共同必修 / 通識缺額分佈。"""
+    distribution = get_credit_gap_distribution()
+    if distribution is None:
+        return jsonify({"error": "系統錯誤"}), 500
+    return jsonify({"distribution": distribution})
+
+
+@app.route("/api/analytics/at-risk", methods=["GET"])
+def analytics_at_risk():
+    """依入學年度與組別統計可能無法如期畢業的人數。?max_load=25 可調整每學期學分上限。"""
+    current_ro_year = current_academic_year()
+    max_load = request.args.get('max_load', 25, type=int)
+    results = get_at_risk_summary(current_ro_year, max_credits_per_semester=max_load)
+    if results is None:
+        return jsonify({"error": "系統錯誤"}), 500
+    return jsonify({"current_year": current_ro_year, "max_load": max_load, "cohorts": results})
+
+
+@app.cli.command("rebuild-rollups")
+def rebuild_rollups_command():
+    """(維護用) flask --app app rebuild-rollups：從現有資料重建所有分析彙總表。"""
+    rebuild_course_stats_rollup()
+    student_ids = list_student_ids()
+    for student_id in student_ids:
+        db_student_info, db_courses = get_student_data_from_db(student_id)
+        if not db_student_info:
+            continue
+        audit_results, totals = calculate_graduation_audit(db_courses)
+        save_audit_rollup(student_id, build_audit_summary(audit_results, totals))
+    print(f"--- 彙總表重建完成，共 {len(student_ids)} 位學生 ---")
+
+
 # ... (原本的 if __name__ == "__main__": 保持不變)
 # --- 程式執行入口 ---
 if __name__ == "__main__":
@@ -0,0 +1,63 @@
+"""
+(效能量測) app.py 冷啟動時間
+
+每次都開新的 Python 行程，量測：
+1. python -X importtime -c "import app" 的模組累計時間 (前幾名)
+2. 冷啟動 "import app" 的 wall-clock 時間
+3. 冷啟動 "import app; app.warm_up()" (pre-fork master 的預熱) 的 wall-clock 時間
+
+執行：python benchmarks/bench_import_time.py [次數]
+"""
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def run_python(code, *flags):
+    return subprocess.run(
+        [sys.executable, *flags, "-c", code],
+        cwd=ROOT, capture_output=True, text=True, check=True,
+    )
+
+
+def wall_clock(code, runs):
+    samples = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        run_python(code)
+        samples.append(time.perf_counter() - start)
+    return statistics.median(samples) * 1000
+
+
+def importtime_top(code, top=10):
+    """解析 -X importtime 的輸出，回傳累計時間前幾名的 (cumulative_us, module)，只看前兩層。"""
+    stderr = run_python(code, "-X", "importtime").stderr
+    rows = []
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        _, cumulative, name = line[len("import time:"):].split("|")
+        depth = (len(name) - len(name.lstrip()) - 1) // 2
+        if cumulative.strip().isdigit() and depth <= 1:
+            # 頂層 + app 直接匯入的模組，太深的層級只會重複計算
+            rows.append((int(cumulative), "  " * depth + name.strip()))
+    rows.sort(reverse=True)
+    return rows[:top]
+
+
+if __name__ == "__main__":
+    runs = int(sys.argv[1]) if len(sys.argv) > 1 else 5
+
+    print("=== python -X importtime -c 'import app' (前兩層模組累計時間) ===")
+    for cumulative, name in importtime_top("import app"):
+        print(f"{cumulative / 1000:9.1f} ms  {name}")
+
+    lazy = wall_clock("import app", runs)
+    eager = wall_clock("import app; app.warm_up()", runs)
+    print()
+    print(f"import app (延遲載入)            : {lazy:7.1f} ms (median of {runs})")
+    print(f"import app; app.warm_up() (預熱) : {eager:7.1f} ms (median of {runs})")
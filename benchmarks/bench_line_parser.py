@@ -0,0 +1,117 @@
+"""
+(效能量測) 課程行解析：COURSE_PATTERN vs 行分類器 + 右錨定切詞器
+
+1. 對一組真實格式的行做 parity 檢查 (結果必須與純 Regex 完全一致)
+2. 量測兩種做法的 lines/sec
+
+執行：python benchmarks/bench_line_parser.py
+"""
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from pdf_parser import COURSE_PATTERN, build_course_record, parse_course_line  # noqa: E402
+
+# 成績單 layout=True 抽出來的各種行 (課程行、表頭、頁尾、學生資訊...)
+REAL_LINES = [
+    "修業年度: 112     學號/姓名/系所",
+    "1121726  王小明  資訊管理學系 商業智慧組",
+    "系所   課號       冊  學年  期  課名                         選別     得分  學分 累計  分數  說明",
+    "------------------------------------------------------------------------------------------",
+    "本系   IM1001     1   112   1   基礎程式設計                 系必     通過   3    3    89",
+    "本系   IM1002     1   112   1   計算機概論                   系必修   通過   3    6    92",
+    "外系   LC1101         112   1   大學英文(一)                 共必     通過   2    8    78",
+    "--     GS2034                2   通識：人文與藝術             通識     通過   2   10    Pass",
+    "本系   IM2301     2   112   2   統計學 (一)                  院必修   未過   3   10    45",
+    "本系   IM2301     2   113   1   統計學 (一)                  院必修   通過   3   13    71",
+    "本系   IM3302     3   113   2   資料庫管理                   系必     通過   3   16    *",
+    "外系   CL1001         112   1   國文                         共同必修 通過   2   18    #",
+    "本系   IM4001     4   114   1   畢業專題                     系必     通過   3   21    88    抵免",
+    "本系   IM4002     4   114   1   服務學習 (二)                選       通過   1   22    90    跨領域 學程",
+    "本系   IM5001         114   2   行動裝置 程式設計            選       通過   3   25    95",
+    "外系   EL2001.1       113   2   English Conversation II      共必     通過   2   27    85",
+    "第 1 頁 / 共 3 頁",
+    "",
+]
+
+# 故意刁難的行：確認切詞器沒把握時會正確退回 Regex
+EDGE_LINES = [
+    "本系   IM6001     1   112   1   課名含通過兩字               選       通過   3   30    80",
+    "本系   IM6002     1   112   1   1 2 3                        選       通過   3   33    80",
+    "本系   IM6003         112       選       通過   3   33    80",
+    "本系   IM6004     1   112   1   專題 選 通過 3 10 85 備註     選       通過   3   36    85",
+    "本系   IM6005     1   112   1   成績待送                     選       通過   3   39    85abc",
+    "本系   im6006     1   112   1   小寫課號                     選       通過   3   42    70",
+    "本系   IM6007     1   112   1   學分兩位數                   選       通過   10  52    70",
+    "本系IM6008     1   112   1   沒有空白                     選       通過   3   55    70",
+    "---    IM6009     1   112   1   三個橫線                     選       通過   3   58    70",
+    "外系   LC1101     112   1   1   共必     通過   2    8    78",
+    "本系",
+    "外系   ",
+]
+
+CORPUS = REAL_LINES + EDGE_LINES
+
+
+def regex_only(line_stripped):
+    """舊版做法：每一行都直接跑 COURSE_PATTERN。"""
+    course_match = COURSE_PATTERN.match(line_stripped)
+    if not course_match:
+        return None
+    return build_course_record(course_match.groupdict())
+
+
+def check_parity(lines):
+    mismatches = 0
+    for line in lines:
+        line_stripped = line.strip()
+        expected = regex_only(line_stripped)
+        actual = parse_course_line(line_stripped)
+        if expected != actual:
+            mismatches += 1
+            print(f"[不一致] {line_stripped!r}\n  regex: {expected}\n  new:   {actual}")
+    return mismatches
+
+
+def fuzz_lines(n, seed=0):
+    """把語料庫的欄位隨機重組，產生更多奇怪但「像真的」的行。"""
+    rng = random.Random(seed)
+    tokens = []
+    for line in CORPUS:
+        tokens.extend(line.split())
+    spaces = [" ", "  ", "   ", "\t"]
+    out = []
+    for _ in range(n):
+        base = rng.choice(CORPUS).split()
+        for _ in range(rng.randint(0, 3)):
+            if base:
+                base[rng.randrange(len(base))] = rng.choice(tokens)
+        out.append("".join(tok + rng.choice(spaces) for tok in base))
+    return out
+
+
+def lines_per_sec(func, lines, repeat=5):
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for line in lines:
+            func(line.strip())
+        best = min(best, time.perf_counter() - start)
+    return len(lines) / best
+
+
+if __name__ == "__main__":
+    fuzzed = fuzz_lines(20000)
+    mismatches = check_parity(CORPUS) + check_parity(fuzzed)
+    print(f"Parity: {len(CORPUS) + len(fuzzed)} 行，不一致 {mismatches} 行")
+
+    workload = REAL_LINES * 5000
+    before = lines_per_sec(regex_only, workload)
+    after = lines_per_sec(parse_course_line, workload)
+    print(f"COURSE_PATTERN only : {before:,.0f} lines/sec")
+    print(f"分類器 + 切詞器     : {after:,.0f} lines/sec ({after / before:.2f}x)")
+
+    sys.exit(1 if mismatches else 0)
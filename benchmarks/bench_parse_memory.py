@@ -0,0 +1,102 @@
+"""
+(效能量測) PDF 解析的峰值記憶體 vs 頁數
+
+每個 (模式, 頁數) 都開新的 Python 行程：先 import pdf_parser 並載入 pdfplumber，記下當下的 RSS，
+解析一份產生出來的成績單後再量一次，回報：
+- peak RSS 增量 (ru_maxrss，Linux 單位為 KB)
+- tracemalloc 峰值 (Python 物件配置)
+
+模式：
+- stream : pdf_parser.parse_pdf_with_regex (串流，每頁處理完就 page.close())
+- legacy : 舊寫法，所有頁面的快取留到 with 結束，且每頁 text.split('\\n')
+
+執行：python benchmarks/bench_parse_memory.py [頁數 ...]   (預設 2 5 10 20 50)
+"""
+import json
+import os
+import subprocess
+import sys
+import tempfile
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+ROOT = os.path.dirname(HERE)
+
+DEFAULT_PAGES = (2, 5, 10, 20, 50)
+MODES = ("legacy", "stream")
+
+
+def legacy_parse(pdf_parser, file_path):
+    """舊版 parse_pdf_with_regex 的記憶體行為 (只保留課程解析)。"""
+    all_courses = []
+    with pdf_parser.get_pdfplumber().open(file_path) as pdf:
+        for page in pdf.pages:
+            text = page.extract_text(layout=True)
+            if not text:
+                continue
+            for line in text.split('\n'):
+                course = pdf_parser.parse_course_line(line.strip())
+                if course:
+                    all_courses.append(course)
+    return all_courses
+
+
+def child(mode, file_path):
+    """在子行程內執行一次解析，把結果用 JSON 印到 stdout 的最後一行。"""
+    import resource
+    import tracemalloc
+
+    sys.path.insert(0, ROOT)
+    import pdf_parser
+    pdf_parser.get_pdfplumber()
+
+    rss_before = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    tracemalloc.start()
+    if mode == "stream":
+        courses, _info = pdf_parser.parse_pdf_with_regex(file_path)
+    else:
+        courses = legacy_parse(pdf_parser, file_path)
+    _current, traced_peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    rss_after = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+    print(json.dumps({
+        "courses": len(courses),
+        "rss_delta_kb": rss_after - rss_before,
+        "traced_peak_kb": traced_peak // 1024,
+    }))
+
+
+def measure(mode, file_path):
+    result = subprocess.run(
+        [sys.executable, os.path.abspath(__file__), "--child", mode, file_path],
+        cwd=ROOT, capture_output=True, text=True, check=True,
+    )
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+
+def main(pages_list):
+    sys.path.insert(0, HERE)
+    from fake_transcript import make_transcript_pdf
+
+    print(f"{'pages':>5} {'courses':>8} " + " ".join(
+        f"{mode + ' RSS MB':>15} {mode + ' py MB':>14}" for mode in MODES))
+    with tempfile.TemporaryDirectory() as tmp:
+        for pages in pages_list:
+            path = os.path.join(tmp, f"transcript_{pages}.pdf")
+            make_transcript_pdf(path, pages=pages)
+            row = {mode: measure(mode, path) for mode in MODES}
+            courses = {r["courses"] for r in row.values()}
+            if len(courses) != 1:
+                print(f"[錯誤] 兩種模式解析出的課程數不同: {row}")
+                return 1
+            print(f"{pages:>5} {courses.pop():>8} " + " ".join(
+                f"{row[mode]['rss_delta_kb'] / 1024:>15.1f} {row[mode]['traced_peak_kb'] / 1024:>14.1f}"
+                for mode in MODES))
+    return 0
+
+
+if __name__ == "__main__":
+    if len(sys.argv) == 4 and sys.argv[1] == "--child":
+        child(sys.argv[2], sys.argv[3])
+    else:
+        sys.exit(main([int(p) for p in sys.argv[1:]] or DEFAULT_PAGES))
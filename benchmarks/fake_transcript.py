@@ -0,0 +1,131 @@
+"""
+產生「假的」成績單 PDF (給壓力測試 / 效能量測用，不需要任何中文字型或額外套件)。
+
+字型用 Type0 + Identity-H，CID 直接等於 Unicode 碼位，再附上 ToUnicode 對照表，
+pdfplumber 抽出來的文字就會跟真的成績單一樣。字不會被正確「畫」出來，但解析不受影響。
+"""
+import random
+import zlib
+
+COURSE_NAMES = [
+    "基礎程式設計", "計算機概論", "大學英文(一)", "國文", "統計學(一)", "資料庫管理",
+    "系統分析與設計", "作業系統", "資料結構", "會計學", "經濟學", "服務學習(一)",
+    "通識：人文與藝術", "通識：社會科學", "行動裝置程式設計", "專題研究",
+]
+COURSE_PREFIXES = ["IM", "IM", "IM", "LC", "EL", "CL", "LS", "LE", "ID", "GN", "GS"]
+COURSE_TYPES = ["系必", "系必修", "院必修", "共必", "共同必修", "通識", "選"]
+
+
+def transcript_lines(student_id="1121726", name="王小明", courses_per_page=40, pages=1, seed=0):
+    """產生每一頁的文字行 (list of list of str)。"""
+    rng = random.Random(seed)
+    cumulative = 0
+    all_pages = []
+    for page_no in range(pages):
+        lines = []
+        if page_no == 0:
+            lines.append("修業年度: 112")
+            lines.append(f"{student_id}  {name}  資訊管理學系 商業智慧組")
+        lines.append("系所   課號       冊  學年  期  課名                 選別     得分  學分 累計  分數  說明")
+        for i in range(courses_per_page):
+            idx = page_no * courses_per_page + i
+            credit = rng.choice([1, 2, 2, 3, 3, 3])
+            passed = rng.random() > 0.08
+            if passed:
+                cumulative += credit
+            score = rng.choice([str(rng.randint(60, 99)), "Pass", "*"]) if passed else str(rng.randint(20, 59))
+            year = 112 + idx // 20
+            term = 1 + (idx // 10) % 2
+            lines.append(
+                f"本系   {rng.choice(COURSE_PREFIXES)}{1000 + idx:04d}     1   {year}   {term}   "
+                f"{rng.choice(COURSE_NAMES)}   {rng.choice(COURSE_TYPES)}   "
+                f"{'通過' if passed else '未過'}   {credit}   {cumulative}   {score}"
+            )
+        lines.append(f"第 {page_no + 1} 頁 / 共 {pages} 頁")
+        all_pages.append(lines)
+    return all_pages
+
+
+def _pdf_string(text):
+    """Identity-H：每個字元用 2 bytes 的 Unicode 碼位當 CID。"""
+    return "<" + "".join(f"{ord(ch):04X}" for ch in text) + ">"
+
+
+def build_pdf(pages_lines):
+    """把每頁的文字行輸出成 PDF bytes。"""
+    chars = sorted({ch for lines in pages_lines for line in lines for ch in line})
+    bfchar = "\n".join(f"<{ord(ch):04X}> <{ord(ch):04X}>" for ch in chars)
+    to_unicode = (
+        "/CIDInit /ProcSet findresource begin\n12 dict begin\nbegincmap\n"
+        "/CIDSystemInfo << /Registry (Adobe) /Ordering (UCS) /Supplement 0 >> def\n"
+        "/CMapName /Adobe-Identity-UCS def\n/CMapType 2 def\n"
+        "1 begincodespacerange\n<0000> <FFFF>\nendcodespacerange\n"
+        f"{len(chars)} beginbfchar\n{bfchar}\nendbfchar\n"
+        "endcmap\nCMapName currentdict /CMap defineresource pop\nend\nend"
+    ).encode("ascii")
+    # 半形字寬 500、全形 1000，讓 layout=True 排出來的欄位間距正常
+    widths = " ".join(f"{ord(ch)} [{500 if ord(ch) < 0x2E80 else 1000}]" for ch in chars)
+
+    objects = []
+
+    def add(body):
+        objects.append(body)
+        return len(objects)
+
+    catalog = add(None)
+    pages_obj = add(None)
+    font = add(None)
+    descriptor = add(
+        "<< /Type /FontDescriptor /FontName /FakeSans /Flags 4 /FontBBox [0 -200 1000 900] "
+        "/ItalicAngle 0 /Ascent 900 /Descent -200 /CapHeight 700 /StemV 80 >>"
+    )
+    cid_font = add(
+        "<< /Type /Font /Subtype /CIDFontType2 /BaseFont /FakeSans "
+        "/CIDSystemInfo << /Registry (Adobe) /Ordering (Identity) /Supplement 0 >> "
+        f"/FontDescriptor {descriptor} 0 R /DW 1000 /W [{widths}] /CIDToGIDMap /Identity >>"
+    )
+    cmap_stream = add(to_unicode)
+    objects[font - 1] = (
+        f"<< /Type /Font /Subtype /Type0 /BaseFont /FakeSans /Encoding /Identity-H "
+        f"/DescendantFonts [{cid_font} 0 R] /ToUnicode {cmap_stream} 0 R >>"
+    )
+
+    page_ids = []
+    for lines in pages_lines:
+        ops = ["BT", "/F1 8 Tf", "10 TL", "20 810 Td"]
+        for line in lines:
+            ops.append(f"{_pdf_string(line)} Tj T*")
+        ops.append("ET")
+        content = add("\n".join(ops).encode("ascii"))
+        page_ids.append(add(
+            f"<< /Type /Page /Parent {pages_obj} 0 R /MediaBox [0 0 595 842] "
+            f"/Resources << /Font << /F1 {font} 0 R >> >> /Contents {content} 0 R >>"
+        ))
+
+    objects[catalog - 1] = f"<< /Type /Catalog /Pages {pages_obj} 0 R >>"
+    kids = " ".join(f"{pid} 0 R" for pid in page_ids)
+    objects[pages_obj - 1] = f"<< /Type /Pages /Kids [{kids}] /Count {len(page_ids)} >>"
+
+    out = bytearray(b"%PDF-1.4\n")
+    offsets = []
+    for number, body in enumerate(objects, start=1):
+        offsets.append(len(out))
+        if isinstance(body, bytes):
+            data = zlib.compress(body)
+            out += f"{number} 0 obj\n<< /Length {len(data)} /Filter /FlateDecode >>\nstream\n".encode("ascii")
+            out += data + b"\nendstream\nendobj\n"
+        else:
+            out += f"{number} 0 obj\n{body}\nendobj\n".encode("ascii")
+    xref = len(out)
+    out += f"xref\n0 {len(objects) + 1}\n0000000000 65535 f \n".encode("ascii")
+    for offset in offsets:
+        out += f"{offset:010d} 00000 n \n".encode("ascii")
+    out += f"trailer\n<< /Size {len(objects) + 1} /Root {catalog} 0 R >>\nstartxref\n{xref}\n%%EOF\n".encode("ascii")
+    return bytes(out)
+
+
+def make_transcript_pdf(path, pages=1, courses_per_page=40, student_id="1121726", seed=0):
+    with open(path, "wb") as f:
+        f.write(build_pdf(transcript_lines(student_id=student_id, pages=pages,
+                                           courses_per_page=courses_per_page, seed=seed)))
+    return path
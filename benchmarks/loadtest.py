@@ -0,0 +1,487 @@
+"""
+(壓力測試) 在單機上重現選課週的尖峰流量，完全離線。
+
+- 啟動一個本機 app (werkzeug threaded server)，資料庫換成記憶體版替身 (或 --db sqlite 用內嵌 SQLite)，
+  Groq 換成本機的假 API (OpenAI 相容格式，可設定延遲)，走的還是真正的 groq SDK
+- 依比例混合呼叫 /api/login、/api/student/data、/api/audit (上傳產生的 PDF)、/api/chat
+- 回報每個 API 的吞吐量、p50/p95/p99 延遲與錯誤率，可設定延遲預算，超過就以 exit code 1 結束
+
+執行範例：
+    python benchmarks/loadtest.py --duration 30 --concurrency 16
+    python benchmarks/loadtest.py --mix login=2,data=5,audit=1,chat=2 --budget chat:p95=1500 --budget data:p99=300
+    python benchmarks/loadtest.py --db sqlite                        # 走真正的 save_to_db (SQLite 後端)
+    python benchmarks/loadtest.py --target http://127.0.0.1:5000   # 打已經在跑的 app (不替換資料庫)
+"""
+import argparse
+import contextlib
+import copy
+import gzip
+import io
+import json
+import logging
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+import urllib.error
+import urllib.request
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+ROOT = os.path.dirname(HERE)
+sys.path.insert(0, ROOT)
+sys.path.insert(0, HERE)
+
+from fake_transcript import build_pdf, transcript_lines  # noqa: E402
+from pdf_parser import parse_course_line  # noqa: E402
+
+ENDPOINTS = ("login", "data", "audit", "chat")
+CHAT_QUESTIONS = [
+    "我還差多少學分才能畢業？",
+    "我還差多少通識學分？",
+    "幫我規劃下學期要修什麼",
+    "我有哪些必修被當？",
+    "1132 我修了哪些課？",
+    "英文學分夠了嗎？",
+]
+
+
+# ==========================================================
+#  假的 Groq API (OpenAI 相容的 /openai/v1/chat/completions)
+# ==========================================================
+class StubGroqHandler(BaseHTTPRequestHandler):
+    latency_ms = 0
+    jitter_ms = 0
+    protocol_version = "HTTP/1.1"
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length", 0))
+        request_body = json.loads(self.rfile.read(length) or b"{}")
+        delay = self.latency_ms + random.uniform(-self.jitter_ms, self.jitter_ms)
+        time.sleep(max(0, delay) / 1000)
+
+        body = json.dumps({
+            "id": f"chatcmpl-{uuid.uuid4().hex}",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": request_body.get("model", "stub"),
+            "choices": [{
+                "index": 0,
+                "message": {"role": "assistant", "content": "**結論**：進度不錯，繼續保持！(stub)"},
+                "finish_reason": "stop",
+            }],
+            "usage": {"prompt_tokens": 1000, "completion_tokens": 50, "total_tokens": 1050},
+        }).encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def start_stub_groq(latency_ms, jitter_ms):
+    StubGroqHandler.latency_ms = latency_ms
+    StubGroqHandler.jitter_ms = jitter_ms
+    server = ThreadingHTTPServer(("127.0.0.1", 0), StubGroqHandler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_port}"
+
+
+# ==========================================================
+#  記憶體版資料庫替身 (介面與 save_to_db 相同)
+# ==========================================================
+class InMemoryStudentStore:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._students = {}  # 學號 -> (student_info, all_courses, version)
+
+    def check_user_exists(self, student_id):
+        with self._lock:
+            entry = self._students.get(student_id)
+        if not entry:
+            return None
+        info = entry[0]
+        return {"id": info["id"], "name": info["name"], "department": info["department"]}
+
+    def save_student_data(self, student_info, all_courses, audit_summary=None):
+        """與 save_to_db 相同：以 (課號, 學年, 期) 合併，只有課程真的有異動時版本號才 +1。"""
+        with self._lock:
+            old = self._students.get(student_info["id"])
+            courses = {self._course_key(c): c for c in old[1]} if old else {}
+            changed = False
+            for course in all_courses:
+                if not course.get("課號"):
+                    continue
+                key = self._course_key(course)
+                if courses.get(key) != course:
+                    courses[key] = copy.deepcopy(course)
+                    changed = True
+            version = (old[2] if old else 0) + (1 if changed else 0)
+            self._students[student_info["id"]] = (dict(student_info), list(courses.values()), version)
+        return True
+
+    @staticmethod
+    def _course_key(course):
+        return course.get("課號"), course.get("學年"), course.get("期")
+
+    def get_student_data_from_db(self, student_id):
+        with self._lock:
+            entry = self._students.get(student_id)
+        if not entry:
+            return None, None
+        return dict(entry[0]), copy.deepcopy(entry[1])
+
+    def get_transcript_version(self, student_id):
+        with self._lock:
+            entry = self._students.get(student_id)
+        return entry[2] if entry else 0
+
+
+def start_local_app(store, llm_url):
+    """在背景執行緒啟動 app，資料庫函式換成 store 提供的版本 (store 為 None 時不替換)。"""
+    os.environ["GROQ_API_KEY"] = "stub-key"
+    os.environ["GROQ_BASE_URL"] = llm_url
+    # 沒有金鑰 app 就不發 token，壓測要走跟正式環境一樣的 token 路徑
+    os.environ.setdefault("SESSION_SECRET_KEY", "loadtest-secret")
+
+    import app as app_module
+    from werkzeug.serving import make_server
+
+    if store is not None:
+        for name in ("check_user_exists", "save_student_data", "get_student_data_from_db", "get_transcript_version"):
+            setattr(app_module, name, getattr(store, name))
+
+    server = make_server("127.0.0.1", 0, app_module.app, threaded=True)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return app_module, server, f"http://127.0.0.1:{server.server_port}"
+
+
+# ==========================================================
+#  模擬學生
+# ==========================================================
+def student_ids(count):
+    return [f"11{n:05d}" for n in range(count)]
+
+
+class PdfFactory:
+    """每位學生的成績單 PDF 只產生一次。"""
+
+    def __init__(self, pages):
+        self.pages = pages
+        self._cache = {}
+        self._lock = threading.Lock()
+
+    def lines(self, student_id):
+        return transcript_lines(student_id=student_id, pages=self.pages, seed=int(student_id))
+
+    def pdf(self, student_id):
+        with self._lock:
+            data = self._cache.get(student_id)
+        if data is None:
+            data = build_pdf(self.lines(student_id))
+            with self._lock:
+                self._cache[student_id] = data
+        return data
+
+
+def seed_store(store, pdfs, students):
+    """直接把解析結果寫進替身資料庫 (不經過 PDF)，讓 data / chat 一開始就有資料。"""
+    for student_id in students:
+        courses = []
+        for page in pdfs.lines(student_id):
+            for line in page:
+                course = parse_course_line(line.strip())
+                if course:
+                    courses.append(course)
+        info = {"id": student_id, "name": "測試生", "year": "112", "department": "資訊管理學系 商業智慧組"}
+        store.save_student_data(info, courses)
+
+
+# ==========================================================
+#  HTTP 用戶端
+# ==========================================================
+def http_post(url, body, headers, timeout):
+    """回傳 (HTTP 狀態碼, 回應標頭, 回應內容)，連線錯誤 / 逾時的狀態碼為 0。"""
+    req = urllib.request.Request(url, data=body, headers=headers, method="POST")
+    try:
+        with urllib.request.urlopen(req, timeout=timeout) as resp:
+            return resp.status, resp.headers, resp.read()
+    except urllib.error.HTTPError as e:
+        return e.code, e.headers, e.read()
+    except (urllib.error.URLError, OSError):
+        return 0, {}, b""
+
+
+def read_token(status, headers, body):
+    """從 login 的回應取出 session token (沒有就回傳 None)。"""
+    if status != 200:
+        return None
+    if headers.get("Content-Encoding") == "gzip":
+        body = gzip.decompress(body)
+    try:
+        return json.loads(body).get("token")
+    except ValueError:
+        return None
+
+
+def post_json(base, path, payload, timeout, extra_headers=None):
+    headers = {"Content-Type": "application/json", "Accept-Encoding": "gzip"}
+    headers.update(extra_headers or {})
+    return http_post(base + path, json.dumps(payload).encode("utf-8"), headers, timeout)
+
+
+def post_pdf(base, pdf_bytes, timeout, extra_headers=None):
+    boundary = uuid.uuid4().hex
+    body = (
+        f"--{boundary}\r\n"
+        'Content-Disposition: form-data; name="pdf_file"; filename="transcript.pdf"\r\n'
+        "Content-Type: application/pdf\r\n\r\n"
+    ).encode("utf-8") + pdf_bytes + f"\r\n--{boundary}--\r\n".encode("utf-8")
+    headers = {"Content-Type": f"multipart/form-data; boundary={boundary}"}
+    headers.update(extra_headers or {})
+    return http_post(base + "/api/audit", body, headers, timeout)
+
+
+class Stats:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.latencies = {name: [] for name in ENDPOINTS}
+        self.statuses = {name: {} for name in ENDPOINTS}
+        self.shed = dict.fromkeys(ENDPOINTS, 0)
+
+    def record(self, endpoint, status, seconds, shed=False):
+        with self._lock:
+            self.statuses[endpoint][status] = self.statuses[endpoint].get(status, 0) + 1
+            if shed:
+                # 被准入控制擋下的請求幾乎不花時間，算進延遲會把百分位數拉低，另外計數
+                self.shed[endpoint] += 1
+            else:
+                self.latencies[endpoint].append(seconds * 1000)
+
+
+def is_shed(status, headers):
+    """503 + Retry-After 是 app 主動卸載 (解析行程池滿了)，不是故障。"""
+    return status == 503 and bool(headers and headers.get("Retry-After"))
+
+
+def percentile(sorted_values, pct):
+    """nearest-rank 百分位數。"""
+    if not sorted_values:
+        return None
+    rank = max(1, int(round(pct / 100 * len(sorted_values) + 0.5)))
+    return sorted_values[min(rank, len(sorted_values)) - 1]
+
+
+def run_worker(args, base, stats, students, pdfs, weights, deadline, counter, rng):
+    etags = {}
+    tokens = {} # 學號 -> 登入時拿到的 session token (像真正的前端一樣帶在 Authorization)
+    while True:
+        if deadline and time.monotonic() >= deadline:
+            return
+        if counter is not None:
+            with counter["lock"]:
+                if counter["left"] <= 0:
+                    return
+                counter["left"] -= 1
+
+        endpoint = rng.choices(ENDPOINTS, weights=weights)[0]
+        student_id = rng.choice(students)
+        auth = {"Authorization": f"Bearer {tokens[student_id]}"} if student_id in tokens else {}
+        start = time.perf_counter()
+
+        if endpoint == "login":
+            status, resp_headers, body = post_json(base, "/api/login", {"student_id": student_id}, args.timeout)
+            token = read_token(status, resp_headers, body)
+            if token:
+                tokens[student_id] = token
+        elif endpoint == "data":
+            headers = dict(auth)
+            if student_id in etags and rng.random() < args.revalidate:
+                headers["If-None-Match"] = etags[student_id]
+            status, resp_headers, _ = post_json(base, "/api/student/data", {"student_id": student_id},
+                                                args.timeout, headers)
+            if resp_headers and resp_headers.get("ETag"):
+                etags[student_id] = resp_headers.get("ETag")
+        elif endpoint == "audit":
+            status, resp_headers, _ = post_pdf(base, pdfs.pdf(student_id), args.timeout, auth)
+        else:
+            status, resp_headers, _ = post_json(base, "/api/chat",
+                                     {"student_id": student_id, "message": rng.choice(CHAT_QUESTIONS)},
+                                     args.timeout, auth)
+
+        stats.record(endpoint, status, time.perf_counter() - start, is_shed(status, resp_headers))
+
+
+def parse_mix(text):
+    mix = dict.fromkeys(ENDPOINTS, 0.0)
+    for part in text.split(","):
+        name, _, weight = part.partition("=")
+        if name.strip() not in mix:
+            raise SystemExit(f"未知的 endpoint: {name} (可用: {', '.join(ENDPOINTS)})")
+        mix[name.strip()] = float(weight)
+    return [mix[name] for name in ENDPOINTS]
+
+
+def parse_budget(text):
+    """'chat:p95=1500' -> ('chat', 95, 1500.0)"""
+    try:
+        endpoint, rest = text.split(":")
+        pct, limit = rest.split("=")
+        return endpoint, float(pct.lstrip("p")), float(limit)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"預算格式應為 endpoint:p95=毫秒，收到 {text!r}")
+
+
+def build_report(stats, elapsed):
+    report = {}
+    for name in ENDPOINTS:
+        values = sorted(stats.latencies[name])
+        statuses = stats.statuses[name]
+        shed = stats.shed[name]
+        total = sum(statuses.values())
+        # 5xx 與連線錯誤 (0) 算錯誤；4xx 是正常的業務回應 (例如查無資料)，
+        # 准入控制的 503 (帶 Retry-After) 另外列在 shed_rate，不算錯誤
+        errors = sum(count for status, count in statuses.items() if status == 0 or status >= 500) - shed
+        report[name] = {
+            "requests": total,
+            "throughput_rps": total / elapsed if elapsed else 0,
+            "p50_ms": percentile(values, 50),
+            "p95_ms": percentile(values, 95),
+            "p99_ms": percentile(values, 99),
+            "error_rate": errors / total if total else 0,
+            "shed_rate": shed / total if total else 0,
+            "statuses": {str(k): v for k, v in sorted(statuses.items())},
+        }
+    return report
+
+
+def print_report(report, elapsed):
+    print(f"\n=== 壓力測試結果 ({elapsed:.1f} 秒) ===")
+    print(f"{'endpoint':<8} {'requests':>8} {'req/s':>8} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'errors':>7} {'shed':>7}  statuses")
+    fmt = lambda v: f"{v:9.1f}" if v is not None else f"{'-':>9}"
+    for name, r in report.items():
+        print(f"{name:<8} {r['requests']:>8} {r['throughput_rps']:>8.1f} {fmt(r['p50_ms'])} {fmt(r['p95_ms'])} "
+              f"{fmt(r['p99_ms'])} {r['error_rate']:>7.1%} {r['shed_rate']:>7.1%}  {r['statuses']}")
+
+
+def check_budgets(report, stats, budgets, max_error_rate, max_shed_rate=None):
+    failures = []
+    for endpoint, pct, limit in budgets:
+        if endpoint not in stats.latencies:
+            failures.append(f"未知的 endpoint: {endpoint}")
+            continue
+        value = percentile(sorted(stats.latencies[endpoint]), pct)
+        if value is not None and value > limit:
+            failures.append(f"{endpoint} p{pct:g} = {value:.1f} ms > 預算 {limit:.0f} ms")
+    if max_error_rate is not None:
+        for name, r in report.items():
+            if r["error_rate"] > max_error_rate:
+                failures.append(f"{name} 錯誤率 {r['error_rate']:.1%} > 上限 {max_error_rate:.1%}")
+    if max_shed_rate is not None:
+        for name, r in report.items():
+            if r["shed_rate"] > max_shed_rate:
+                failures.append(f"{name} 卸載率 {r['shed_rate']:.1%} > 上限 {max_shed_rate:.1%}")
+    return failures
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="畢業審查系統本機壓力測試 (離線)")
+    parser.add_argument("--target", help="打已經在跑的 app (例如 http://127.0.0.1:5000)；不指定則自動啟動本機 app")
+    parser.add_argument("--concurrency", type=int, default=8, help="同時連線數 (預設 8)")
+    parser.add_argument("--duration", type=float, default=20, help="測試秒數 (預設 20)")
+    parser.add_argument("--requests", type=int, help="總請求數 (指定時忽略 --duration)")
+    parser.add_argument("--mix", default="login=2,data=5,audit=1,chat=2", help="各 API 的權重")
+    parser.add_argument("--db", choices=("memory", "sqlite"), default="memory",
+                        help="本機 app 的資料庫：記憶體替身或 save_to_db 的 SQLite 後端 (暫存檔)")
+    parser.add_argument("--students", type=int, default=200, help="模擬學生人數")
+    parser.add_argument("--pages", type=int, default=2, help="產生的成績單頁數")
+    parser.add_argument("--revalidate", type=float, default=0.5, help="data 請求帶 If-None-Match 的比例")
+    parser.add_argument("--llm-latency-ms", type=float, default=800, help="假 Groq API 的回應延遲")
+    parser.add_argument("--llm-jitter-ms", type=float, default=200)
+    parser.add_argument("--timeout", type=float, default=60, help="單一請求逾時秒數")
+    parser.add_argument("--budget", type=parse_budget, action="append", default=[],
+                        help="延遲預算，例如 chat:p95=1500 (可重複)")
+    parser.add_argument("--max-error-rate", type=float, help="任一 API 錯誤率超過此值就失敗 (例如 0.01)")
+    parser.add_argument("--max-shed-rate", type=float,
+                        help="任一 API 被准入控制擋下 (503 + Retry-After) 的比例上限；預設不檢查")
+    parser.add_argument("--json", help="把結果另存成 JSON 檔")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--verbose", action="store_true", help="顯示本機 app 的 print 與 request log")
+    args = parser.parse_args(argv)
+
+    students = student_ids(args.students)
+    pdfs = PdfFactory(args.pages)
+
+    if args.target:
+        base = args.target.rstrip("/")
+        print(f"--- 目標: {base} (外部 app，資料庫與 LLM 不替換) ---")
+    else:
+        _llm_server, llm_url = start_stub_groq(args.llm_latency_ms, args.llm_jitter_ms)
+        if args.db == "sqlite":
+            import save_to_db
+            db_dir = tempfile.mkdtemp(prefix="loadtest-")
+            save_to_db.configure_backend("sqlite", os.path.join(db_dir, "loadtest.db"))
+            store = save_to_db
+            app_module, _app_server, base = start_local_app(None, llm_url)
+        else:
+            store = InMemoryStudentStore()
+            app_module, _app_server, base = start_local_app(store, llm_url)
+        quiet = contextlib.nullcontext() if args.verbose else contextlib.redirect_stdout(io.StringIO())
+        with quiet:
+            seed_store(store, pdfs, students)
+        print(f"--- 本機 app: {base}，資料庫: {args.db}，假 Groq: {llm_url}，已建立 {len(students)} 位學生 ---")
+
+    weights = parse_mix(args.mix)
+    stats = Stats()
+    counter = {"left": args.requests, "lock": threading.Lock()} if args.requests else None
+    deadline = None if args.requests else time.monotonic() + args.duration
+
+    print(f"--- 開始壓測: concurrency={args.concurrency}, mix={args.mix} ---")
+    saved_stdout_fd = None
+    if not args.verbose:
+        # app 每個請求都會 print 進度 (包含解析子行程)，壓測時直接把 fd 1 導到 /dev/null，
+        # 避免終端機 I/O 拖慢結果
+        logging.getLogger("werkzeug").setLevel(logging.ERROR)
+        sys.stdout.flush()
+        saved_stdout_fd = os.dup(1)
+        devnull_fd = os.open(os.devnull, os.O_WRONLY)
+        os.dup2(devnull_fd, 1)
+        os.close(devnull_fd)
+    start = time.monotonic()
+    workers = [
+        threading.Thread(target=run_worker,
+                         args=(args, base, stats, students, pdfs, weights, deadline, counter,
+                               random.Random(args.seed + i)))
+        for i in range(args.concurrency)
+    ]
+    for w in workers:
+        w.start()
+    for w in workers:
+        w.join()
+    elapsed = time.monotonic() - start
+    if saved_stdout_fd is not None:
+        sys.stdout.flush()
+        os.dup2(saved_stdout_fd, 1)
+        os.close(saved_stdout_fd)
+
+    report = build_report(stats, elapsed)
+    print_report(report, elapsed)
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump({"elapsed_sec": elapsed, "endpoints": report}, f, ensure_ascii=False, indent=2)
+
+    failures = check_budgets(report, stats, args.budget, args.max_error_rate, args.max_shed_rate)
+    for failure in failures:
+        print(f"[超出預算] {failure}")
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
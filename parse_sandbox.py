@@ -0,0 +1,171 @@
+import os
+import signal
+import threading
+import weakref
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, TimeoutError as FuturesTimeoutError
+from concurrent.futures.process import BrokenProcessPool
+from pdf_parser import ParseError, ParseLimitError, get_pdfplumber, parse_pdf_with_regex
+
+# ==========================================================
+#  PDF 解析沙盒：在獨立的 worker 行程裡執行 pdfplumber
+# ==========================================================
+# 大型或格式錯誤的 PDF 可能會吃滿 CPU、把記憶體撐大，
+# 放在 Flask worker 裡跑的話，整個 worker 之後都會受影響。
+# 這裡用一個有上限的行程池來解析：
+#   - 同時解析 + 排隊的工作數有上限，超過直接回報「忙碌中」(503)
+#   - 每個工作有 wall-clock 逾時
+#   - worker 有記憶體上限 (RLIMIT_AS)
+#   - 頁數 / 檔案大小上限 (413)
+#   - 每個 worker 處理 N 個工作後就換新的行程，避免記憶體越長越大
+
+
+# ParseError / ParseLimitError 定義在 pdf_parser (解析過程本身也會丟出)，這裡一併匯出
+class ParseOverloadedError(ParseError):
+    """同時解析的工作太多 (對應 HTTP 503)。"""
+
+
+class ParseTimeoutError(ParseError):
+    """解析時間超過上限 (對應 HTTP 503)。"""
+
+
+class ParseWorkerRestartError(ParseError):
+    """行程池因為其他工作逾時被重啟，這個工作被連帶中斷 (對應 HTTP 503，可重試)。"""
+
+
+def _init_worker(max_memory_mb):
+    """worker 行程初始化：設定記憶體上限，並先載入 pdfplumber (匯入時間不算進第一個工作的逾時)。"""
+    if max_memory_mb:
+        try:
+            import resource
+            limit = max_memory_mb * 1024 * 1024
+            resource.setrlimit(resource.RLIMIT_AS, (limit, limit))
+        except (ImportError, ValueError, OSError) as e:
+            # 非 Linux / 權限不足時無法設定，只靠逾時與換新 worker 保護
+            print(f"[警告] 無法設定解析 worker 記憶體上限: {e}")
+    get_pdfplumber()
+
+
+def _on_timeout(signum, frame):
+    raise ParseTimeoutError("PDF 解析逾時")
+
+
+def _parse_job(file_path, max_pages, timeout):
+    """在 worker 行程中執行：解析 PDF，逾時或記憶體不足時轉成 ParseError。"""
+    signal.signal(signal.SIGALRM, _on_timeout)
+    signal.setitimer(signal.ITIMER_REAL, timeout)
+    try:
+        return parse_pdf_with_regex(file_path, max_pages=max_pages)
+    except MemoryError:
+        raise ParseLimitError("PDF 解析超過記憶體上限")
+    finally:
+        signal.setitimer(signal.ITIMER_REAL, 0)
+
+
+class ParseExecutor:
+    """
+    有上限的 PDF 解析行程池。
+
+    行程池在第一次解析時才建立 (不會在 pre-fork 的 master 裡就先開好)。
+    enabled=False 時直接在目前的行程解析 (開發 / 除錯用)，但仍會檢查頁數上限。
+    """
+
+    def __init__(self, max_workers=2, max_queue=4, job_timeout=30, max_pages=50,
+                 max_bytes=10 * 1024 * 1024, max_memory_mb=1024, max_jobs_per_worker=20,
+                 enabled=True):
+        self.max_workers = max_workers
+        self.max_queue = max_queue
+        self.job_timeout = job_timeout
+        self.max_pages = max_pages
+        self.max_bytes = max_bytes
+        self.max_memory_mb = max_memory_mb
+        self.max_jobs_per_worker = max_jobs_per_worker
+        self.enabled = enabled
+
+        # 正在解析 + 排隊中的工作上限
+        self._slots = threading.BoundedSemaphore(max_workers + max_queue)
+        self._pool = None
+        self._pool_lock = threading.Lock()
+        # 被我們主動重啟的行程池：其他同時在跑的工作會收到 BrokenProcessPool，
+        # 要跟「worker 自己掛掉」(413) 區分開來
+        self._reset_pools = weakref.WeakSet()
+
+    def _get_pool(self):
+        if self._pool is None:
+            with self._pool_lock:
+                if self._pool is None:
+                    self._pool = ProcessPoolExecutor(
+                        max_workers=self.max_workers,
+                        mp_context=multiprocessing.get_context("spawn"),
+                        initializer=_init_worker,
+                        initargs=(self.max_memory_mb,),
+                        max_tasks_per_child=self.max_jobs_per_worker,
+                    )
+        return self._pool
+
+    def _reset_pool(self, pool):
+        """worker 卡死或異常結束時，強制關掉整個行程池，下一個工作會建立新的。"""
+        with self._pool_lock:
+            if self._pool is pool:
+                self._pool = None
+            self._reset_pools.add(pool)
+        # (最後手段) ProcessPoolExecutor 沒有公開的 kill API，只能直接終止子行程
+        for process in list(getattr(pool, "_processes", {}).values()):
+            process.terminate()
+        pool.shutdown(wait=False, cancel_futures=True)
+
+    def _result_timeout(self):
+        """最壞情況：前面排滿的工作都跑到逾時才輪到自己。"""
+        rounds = 1 + (self.max_queue + self.max_workers - 1) // self.max_workers
+        return self.job_timeout * rounds + 5
+
+    def check_size(self, file_path):
+        """檢查檔案大小，超過上限丟出 ParseLimitError。"""
+        size = os.path.getsize(file_path)
+        if self.max_bytes and size > self.max_bytes:
+            raise ParseLimitError(f"檔案大小 {size} bytes 超過上限 {self.max_bytes} bytes")
+
+    def parse(self, file_path):
+        """
+        在沙盒中解析 PDF。
+
+        Returns:
+            (all_courses, student_info)，與 parse_pdf_with_regex 相同
+        Raises:
+            ParseOverloadedError / ParseTimeoutError / ParseWorkerRestartError (503)
+            ParseLimitError (413)
+        """
+        self.check_size(file_path)
+
+        if not self.enabled:
+            return parse_pdf_with_regex(file_path, max_pages=self.max_pages)
+
+        if not self._slots.acquire(blocking=False):
+            raise ParseOverloadedError("目前解析工作過多，請稍後再試")
+        try:
+            pool = self._get_pool()
+            try:
+                future = pool.submit(_parse_job, file_path, self.max_pages, self.job_timeout)
+                # worker 內部用 SIGALRM 控制逾時；這裡的上限包含排隊時間再加一點緩衝，
+                # 當作 worker 卡在 C 程式碼、SIGALRM 沒有作用時的保險
+                return future.result(timeout=self._result_timeout())
+            except FuturesTimeoutError:
+                self._reset_pool(pool)
+                raise ParseTimeoutError("PDF 解析逾時")
+            except BrokenProcessPool:
+                with self._pool_lock:
+                    collateral = pool in self._reset_pools
+                if collateral:
+                    # 別的工作逾時，整個行程池被重啟；這個檔案本身沒問題，請前端稍後重試
+                    raise ParseWorkerRestartError("解析服務重新啟動中，請稍後再試")
+                # worker 被系統砍掉 (例如 OOM killer)，通常代表檔案太吃資源
+                self._reset_pool(pool)
+                raise ParseLimitError("PDF 解析 worker 異常結束")
+        finally:
+            self._slots.release()
+
+    def shutdown(self):
+        with self._pool_lock:
+            pool, self._pool = self._pool, None
+        if pool is not None:
+            pool.shutdown(wait=True, cancel_futures=True)
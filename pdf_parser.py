@@ -0,0 +1,301 @@
+import re
+import threading
+from typing import Tuple, Iterator
+
+# ==========================================================
+#  PDF 成績單解析 (學生資訊 + 課程列表)
+# ==========================================================
+# 獨立成一個輕量模組：Flask (app.py) 與解析沙盒的 worker 行程 (parse_sandbox.py)
+# 都從這裡匯入，worker 不必載入 Flask / 資料庫 / AI 等整個 app。
+
+
+class ParseError(Exception):
+    """解析沙盒錯誤的基底類別。"""
+
+
+class ParseLimitError(ParseError):
+    """檔案大小、頁數或記憶體超過上限 (對應 HTTP 413)。"""
+
+
+# ==========================================
+#  (效能) 延遲載入：pdfplumber 用到時才匯入
+# ==========================================
+_pdfplumber = None
+_pdfplumber_lock = threading.Lock()
+
+
+def get_pdfplumber():
+    """第一次解析 PDF 時才匯入 pdfplumber。"""
+    global _pdfplumber
+    if _pdfplumber is None:
+        with _pdfplumber_lock:
+            if _pdfplumber is None:
+                import pdfplumber
+                _pdfplumber = pdfplumber
+    return _pdfplumber
+
+
+# (這是 message_idx: 75 的效能優化版 Regex)
+COURSE_PATTERN = re.compile(
+    r"^\s*"  # 匹配行首的任何空白
+    r"(?P<系所>本系|外系|--)\s+"
+    r"(?P<課號>[A-Z0-9.]+)\s+"
+    r"(?:" 
+    r"(?P<冊_full>\d+)\s+(?P<學年_full>\d+)\s+(?P<期_full>\d+)"
+    r"|" 
+    r"(?P<期_only>\d+)"
+    r")\s+" 
+    r"(?P<課名>.+?)\s+"
+    
+    # (已優化排序，最長的放前面)
+    r"(?P<選別>系必修|院必修|共同必修|共必|通識|系必|選)\s+"
+    
+    r"(?P<得分>通過|未過)\s+"
+    r"(?P<學分>\d)\s+"
+    r"(?P<累計>\d+)\s+"
+    r"(?P<分數>#|\*|\d+|Pass)\s*"
+    r"(?P<說明>.*)?$"
+)
+
+# (新) 抓取學生資訊的 Regex
+YEAR_PATTERN = re.compile(r"修業年度:\s*(\d+)")
+STUDENT_PATTERN = re.compile(r"(\d{7,})\s+([\u4e00-\u9fa5]+)\s+([\u4e00-\u9fa5\s]+)")
+
+# ==========================================
+#  (效能) 行分類器 + 右錨定切詞器
+# ==========================================
+# COURSE_PATTERN 的 (?P<課名>.+?) 會大量回溯，所以先用便宜的檢查擋掉非課程行，
+# 再用 split / rsplit 切出固定欄位，只有切不乾淨的行才交給 Regex 處理。
+COURSE_LEAD_TOKENS = ("本系", "外系", "--")
+COURSE_TYPE_TOKENS = {"系必修", "院必修", "共同必修", "共必", "通識", "系必", "選"}
+COURSE_STATUS_TOKENS = {"通過", "未過"}
+COURSE_SCORE_TOKENS = {"#", "*", "Pass"}
+COURSE_ID_CHARS = frozenset("ABCDEFGHIJKLMNOPQRSTUVWXYZ0123456789.")
+
+
+def is_course_line(line_stripped: str) -> bool:
+    """
+    (行分類器) 第一個欄位必須是「本系 / 外系 / --」才可能是課程行。
+    與 COURSE_PATTERN 的 ^(本系|外系|--)\\s+ 完全等價。
+    """
+    return (
+        len(line_stripped) > 2
+        and line_stripped[:2] in COURSE_LEAD_TOKENS
+        and line_stripped[2].isspace()
+    )
+
+
+def tokenize_course_line(line_stripped: str):
+    """
+    (右錨定切詞器) 從右邊切出「選別 得分 學分 累計 分數」五個固定欄位，
+    再從左邊切出「系所 課號 (冊 學年) 期」，剩下的就是課名。
+
+    只處理「說明」為空的標準行，回傳與 build_course_record 相同格式的課程字典；
+    任何沒把握的情況都回傳 None，交給 Regex。
+    """
+    tail = line_stripped.rsplit(None, 5)
+    if len(tail) != 6:
+        return None
+    head, course_type, status, credit, cumulative, score = tail
+
+    if course_type not in COURSE_TYPE_TOKENS or status not in COURSE_STATUS_TOKENS:
+        return None
+    if len(credit) != 1 or not credit.isdecimal() or not cumulative.isdecimal():
+        return None
+    if score not in COURSE_SCORE_TOKENS and not score.isdecimal():
+        return None
+
+    parts = head.split(None, 2)
+    if len(parts) != 3:
+        return None
+    dept, course_id, rest = parts
+    if dept not in COURSE_LEAD_TOKENS or not COURSE_ID_CHARS.issuperset(course_id):
+        return None
+    # 課名若含有「通過 / 未過」，Regex 的 lazy 課名可能在更左邊就配對成功，交給 Regex 判斷
+    if "通過" in rest or "未過" in rest:
+        return None
+
+    # Regex 先試「冊 學年 期」，失敗才退回只有「期」
+    # (課名在 Regex 裡可以是單一空白字元，切出來是空的就交給 Regex)
+    nums = rest.split(None, 3)
+    if len(nums) == 4 and nums[0].isdecimal() and nums[1].isdecimal() and nums[2].isdecimal():
+        book, year, term, name = nums
+    elif len(nums) >= 3 and nums[0].isdecimal() and nums[1].isdecimal() and nums[2].isdecimal():
+        return None
+    else:
+        nums = rest.split(None, 1)
+        if len(nums) != 2 or not nums[0].isdecimal():
+            return None
+        book, year = None, None
+        term, name = nums
+
+    # 直接組成與 build_course_record 相同格式的字典 (說明為空 -> None)
+    return {
+        '系所': dept, '課號': course_id, '冊': book, '學年': year, '期': term,
+        '課名': name, '選別': course_type, '得分': status,
+        '學分': credit, '累計': cumulative, '分數': score, '說明': None,
+    }
+
+
+def build_course_record(course_raw: dict) -> dict:
+    """把 COURSE_PATTERN 的 groupdict 轉成課程字典。"""
+    course = {}
+
+    course['系所'] = course_raw['系所']
+    course['課號'] = course_raw['課號']
+
+    if course_raw['期_full']:
+        course['冊'] = course_raw['冊_full']
+        course['學年'] = course_raw['學年_full']
+        course['期'] = course_raw['期_full']
+    else:
+        course['冊'] = None
+        course['學年'] = None
+        course['期'] = course_raw['期_only']
+
+    course['課名'] = course_raw['課名']
+    course['選別'] = course_raw['選別']
+    course['得分'] = course_raw['得分']
+    course['學分'] = course_raw['學分']
+    course['累計'] = course_raw['累計']
+    course['分數'] = course_raw['分數']
+    course['說明'] = course_raw['說明']
+
+    for key, value in course.items():
+        if value == "" or value is None:
+            course[key] = None
+
+    return course
+
+
+def parse_course_line(line_stripped: str):
+    """
+    解析單一行課程資料，不是課程行就回傳 None。
+    流程：行分類器 -> 右錨定切詞器 -> (退回) COURSE_PATTERN
+    """
+    if not is_course_line(line_stripped):
+        return None
+
+    course = tokenize_course_line(line_stripped)
+    if course is not None:
+        return course
+
+    course_match = COURSE_PATTERN.match(line_stripped)
+    if not course_match:
+        return None
+    return build_course_record(course_match.groupdict())
+
+def iter_text_lines(text: str) -> Iterator[str]:
+    """(效能) 逐行產生 text 的內容，不像 text.split('\n') 一次建出整頁的 list。"""
+    start = 0
+    while True:
+        end = text.find('\n', start)
+        if end == -1:
+            yield text[start:]
+            return
+        yield text[start:end]
+        start = end + 1
+
+
+def iter_pdf_courses(pdf, student_info: dict) -> Iterator[dict]:
+    """
+    (新) 串流解析：逐頁產生課程資料，每頁處理完就釋放該頁快取的版面物件。
+    記憶體用量只跟「單頁」有關，不會隨頁數成長。
+
+    Args:
+        pdf: 已開啟的 pdfplumber PDF
+        student_info: 第一頁找到的學生資訊會直接寫入這個 dict
+    Yields:
+        課程 dict (格式與 parse_course_line 相同)
+    """
+    found_year = False
+    found_student = False
+
+    for i, page in enumerate(pdf.pages):
+        try:
+            # (效能修正) 使用 layout=True 強制 pdfplumber 進行排版
+            text = page.extract_text(layout=True)
+        finally:
+            # (效能) 文字取出後，chars / layout / textmap 等快取就用不到了，馬上釋放
+            page.close()
+
+        if not text:
+            continue
+
+        for line in iter_text_lines(text):
+            line_stripped = line.strip()
+
+            # (新) 嘗試匹配學生資訊 (只在第一頁且尚未找到時)
+            if i == 0:
+                # --- ↓↓↓ (Bug 修正) 獨立判斷 ---
+                # (效能) 先用字串包含檢查，沒有「修業年度」就不跑 Regex
+                if not found_year and "修業年度" in line_stripped:
+                    year_match = YEAR_PATTERN.search(line_stripped)
+                    if year_match:
+                        student_info["year"] = year_match.group(1)
+                        found_year = True # 標記已找到
+
+                if not found_student:
+                    student_match = STUDENT_PATTERN.search(line_stripped)
+                    if student_match:
+                        student_info["id"] = student_match.group(1)
+                        student_info["name"] = student_match.group(2)
+                        student_info["department"] = student_match.group(3).strip()
+                        found_student = True # 標記已找到
+                # --- ↑↑↑ 修正結束 ↑↑↑ ---
+
+            # 嘗試匹配課程 (行分類器 + 切詞器，必要時才退回 COURSE_PATTERN)
+            course = parse_course_line(line_stripped)
+            if course:
+                yield course
+
+        # 這一頁的字串也不再需要
+        del text
+
+
+def parse_pdf_with_regex(file_path: str, max_pages: int = None) -> Tuple[list, dict]: 
+    """
+    開啟 PDF，逐行讀取文字，解析「學生資訊」和「課程列表」。
+    (效能) 內部使用 iter_pdf_courses 串流解析，峰值記憶體不隨頁數成長。
+    
+    Args:
+        max_pages: (選用) 頁數上限，超過時丟出 ParseLimitError
+    Returns:
+        (all_courses, student_info)
+    """
+    
+    print(f"--- (1/3)  正在使用 Regex (規則配對) 讀取: {file_path} ---")
+    
+    student_info = {
+        "year": None,
+        "id": None,
+        "name": None,
+        "department": None
+    }
+
+    try:
+        with get_pdfplumber().open(file_path) as pdf:
+            print(f"檔案總頁數: {len(pdf.pages)}")
+            if max_pages and len(pdf.pages) > max_pages:
+                raise ParseLimitError(f"PDF 共 {len(pdf.pages)} 頁，超過上限 {max_pages} 頁")
+
+            all_courses = list(iter_pdf_courses(pdf, student_info))
+
+        if not all_courses:
+            print("[警告] 成功開啟 PDF，但 Regex 未能匹配到任何課程資料。")
+            return [], student_info
+            
+        print(f"Regex 配對成功，共擷取 {len(all_courses)} 筆課程資料。")
+        print(f"學生資訊: {student_info}")
+        
+        return all_courses, student_info
+        
+    except (ParseError, MemoryError):
+        # 資源上限相關的錯誤交給解析沙盒 / 呼叫端處理
+        raise
+    except FileNotFoundError:
+        print(f"[錯誤] 找不到檔案: {file_path}")
+        return [], {}
+    except Exception as e:
+        print(f"[錯誤] 讀取或解析 PDF 時發生意外: {e}")
+        return [], {}
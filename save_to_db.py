@@ -1,16 +1,416 @@
+import os
+import re
+import time
+import sqlite3
+import threading
+from decimal import Decimal
 import mysql.connector
-from mysql.connector import Error
+from mysql.connector import Error as MySQLError
 
-# 資料庫連線設定
+# 資料庫連線設定 (可用 .env 的 DB_HOST / DB_USER / DB_PASSWORD / DB_NAME 覆寫)
 db_config = {
-    'host': '127.0.0.1',
-    'user': 'SADPython',      
-    'password': '&Louis0811',  
-    'database': 'sadpython',  
+    'host': os.getenv('DB_HOST', '127.0.0.1'),
+    'user': os.getenv('DB_USER', 'SADPython'),      
+    'password': os.getenv('DB_PASSWORD', '&Louis0811'),  
+    'database': os.getenv('DB_NAME', 'sadpython'),  
     'connection_timeout': 5,
     'use_pure': True
 }
 
+# ==========================================================
+#  (新增) 儲存後端：mysql (預設) 或 sqlite (單機 / 測試 / 壓測用)
+# ==========================================================
+# DB_BACKEND=sqlite 時改用內嵌的 SQLite 檔案 (SQLITE_PATH)，不需要架 MySQL。
+# 兩種後端共用同一份 SQL，只有 upsert / INSERT IGNORE / GREATEST 等方言
+# 由 _upsert_clause() 等小函式產生；連線物件提供與 mysql.connector 相同的介面。
+DB_BACKEND = os.getenv('DB_BACKEND', 'mysql').lower()
+SQLITE_PATH = os.getenv('SQLITE_PATH', 'graduation.db')
+
+# 兩種後端的錯誤都要接住
+DB_ERRORS = (MySQLError, sqlite3.Error)
+
+# SQLite 沒有 DECIMAL 型別：寫入時轉字串 (NUMERIC affinity 會存成數字)，
+# 讀取宣告為 DECIMAL 的欄位時轉回 Decimal，與 mysql.connector 回傳的型別一致
+sqlite3.register_adapter(Decimal, str)
+sqlite3.register_converter("DECIMAL", lambda raw: Decimal(raw.decode()))
+
+# 核心資料表 (STUDENT / COURSE / TRANSCRIPT)：MySQL 上須事先建立 (見 README「初始化資料庫」)，
+# 這裡的定義只用在 SQLite 第一次連線時自動建表
+CORE_TABLES_DDL = [
+    """
+    CREATE TABLE IF NOT EXISTS STUDENT (
+        StudentID VARCHAR(20) NOT NULL PRIMARY KEY,
+        StudentName VARCHAR(50) NULL,
+        EnrollmentYear INT NULL,
+        Department VARCHAR(50) NULL,
+        Major VARCHAR(50) NULL,
+        StudentStatus VARCHAR(20) NULL
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS COURSE (
+        CourseID VARCHAR(20) NOT NULL PRIMARY KEY,
+        CourseName VARCHAR(100) NULL,
+        Credits DECIMAL(4,1) NULL,
+        OfferingDepartment VARCHAR(10) NULL
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS TRANSCRIPT (
+        StudentID VARCHAR(20) NOT NULL,
+        CourseID VARCHAR(20) NOT NULL,
+        Semester VARCHAR(10) NOT NULL,
+        Grade VARCHAR(10) NULL,
+        IsPassed TINYINT NULL,
+        CourseTypeAsTaken VARCHAR(20) NULL,
+        Remarks VARCHAR(255) NULL,
+        DepartmentType VARCHAR(10) NULL,
+        Book VARCHAR(10) NULL,
+        CumulativeCredits VARCHAR(10) NULL,
+        PRIMARY KEY (StudentID, CourseID, Semester)
+    )
+    """,
+]
+
+_sqlite_local = threading.local()   # 每個執行緒各自持有連線 (sqlite3 連線不能跨執行緒)
+_sqlite_ready_paths = set()         # 已經建好資料表的資料庫檔案
+_sqlite_schema_lock = threading.Lock()
+
+
+class _SQLiteCursor:
+    """把 mysql.connector 風格的呼叫 (%s 參數、dictionary=True) 轉給 sqlite3。"""
+
+    _sql_cache = {}  # 原始 SQL -> 換成 ? 參數的 SQL
+
+    def __init__(self, connection, dictionary=False):
+        self._cursor = connection.cursor()
+        if dictionary:
+            self._cursor.row_factory = lambda cur, row: {
+                col[0]: value for col, value in zip(cur.description, row)
+            }
+
+    @classmethod
+    def _translate(cls, sql):
+        translated = cls._sql_cache.get(sql)
+        if translated is None:
+            translated = cls._sql_cache[sql] = sql.replace('%s', '?')
+        return translated
+
+    def execute(self, sql, params=()):
+        # sqlite3 會依 SQL 字串重複使用已編譯的 prepared statement
+        self._cursor.execute(self._translate(sql), params)
+
+    def executemany(self, sql, seq_of_params):
+        self._cursor.executemany(self._translate(sql), seq_of_params)
+
+    def fetchone(self):
+        return self._cursor.fetchone()
+
+    def fetchall(self):
+        return self._cursor.fetchall()
+
+    def fetchmany(self, size):
+        return self._cursor.fetchmany(size)
+
+    def close(self):
+        self._cursor.close()
+
+
+class _SQLiteConnection:
+    """
+    包裝每個執行緒共用的 sqlite3 連線，介面與 mysql.connector 的連線相同。
+    close() 不會真的關閉連線，只會回滾未 commit 的交易，效果與 MySQL 關閉連線時相同；
+    同一個執行緒之後的呼叫會沿用這條連線與它的 prepared statement 快取。
+    注意快取只在「執行緒重複使用」時有效 (例如 gunicorn gthread 的執行緒池、壓測的匯入迴圈)：
+    werkzeug 開發伺服器 (threaded=True) 每個請求都開新執行緒，等於每個請求各開一條新連線，
+    快取只在同一個請求內有用。
+    """
+
+    def __init__(self, connection):
+        self._connection = connection
+
+    def cursor(self, dictionary=False, buffered=False):
+        return _SQLiteCursor(self._connection, dictionary=dictionary)
+
+    def commit(self):
+        self._connection.commit()
+
+    def rollback(self):
+        self._connection.rollback()
+
+    def is_connected(self):
+        return True
+
+    def close(self):
+        if self._connection.in_transaction:
+            self._connection.rollback()
+
+
+def _open_sqlite(path):
+    connection = sqlite3.connect(
+        path, timeout=db_config['connection_timeout'],
+        detect_types=sqlite3.PARSE_DECLTYPES, cached_statements=256
+    )
+    # WAL：讀取不會被寫入擋住；synchronous=NORMAL 在 WAL 下仍可保證不會損毀
+    connection.execute("PRAGMA journal_mode=WAL")
+    connection.execute("PRAGMA synchronous=NORMAL")
+    with _sqlite_schema_lock:
+        if path not in _sqlite_ready_paths:
+            for ddl in CORE_TABLES_DDL + INGEST_TABLES_DDL + ANALYTICS_TABLES_DDL:
+                for statement in _sqlite_ddl(ddl):
+                    connection.execute(statement)
+            connection.commit()
+            _sqlite_ready_paths.add(path)
+    return connection
+
+
+def _connect():
+    """依 DB_BACKEND 取得連線 (用法與 mysql.connector.connect(**db_config) 相同)。"""
+    if DB_BACKEND != 'sqlite':
+        return mysql.connector.connect(**db_config)
+
+    connections = getattr(_sqlite_local, 'connections', None)
+    if connections is None:
+        connections = _sqlite_local.connections = {}
+    connection = connections.get(SQLITE_PATH)
+    if connection is None:
+        connection = connections[SQLITE_PATH] = _open_sqlite(SQLITE_PATH)
+    return _SQLiteConnection(connection)
+
+
+def configure_backend(backend, sqlite_path=None):
+    """(測試 / 壓測用) 在執行期間切換儲存後端，例如 configure_backend('sqlite', '/tmp/test.db')。"""
+    global DB_BACKEND, SQLITE_PATH, _support_tables_ready
+    DB_BACKEND = backend.lower()
+    if sqlite_path:
+        SQLITE_PATH = sqlite_path
+    _support_tables_ready = False
+    invalidate_course_catalog()
+
+
+# --- SQL 方言 ---
+def _sqlite_ddl(ddl):
+    """
+    把 MySQL 的 CREATE TABLE 轉成 SQLite 可執行的敘述 (資料表只定義一次，兩種後端共用)：
+    - AUTO_INCREMENT 主鍵 -> INTEGER PRIMARY KEY AUTOINCREMENT
+    - 拿掉 ON UPDATE CURRENT_TIMESTAMP (SQLite 沒有；寫入時由 SQL 明確更新 UpdatedAt)
+    - 表內的 INDEX 定義拆成獨立的 CREATE INDEX
+    """
+    ddl = ddl.replace("BIGINT NOT NULL AUTO_INCREMENT PRIMARY KEY", "INTEGER PRIMARY KEY AUTOINCREMENT")
+    ddl = ddl.replace(" ON UPDATE CURRENT_TIMESTAMP", "")
+    table = re.search(r"CREATE TABLE IF NOT EXISTS (\w+)", ddl).group(1)
+    indexes = [
+        f"CREATE INDEX IF NOT EXISTS {name} ON {table} ({columns})"
+        for name, columns in re.findall(r",\s*INDEX (\w+) \(([^)]*)\)", ddl)
+    ]
+    return [re.sub(r",\s*INDEX \w+ \([^)]*\)", "", ddl)] + indexes
+
+
+def _insert_ignore():
+    return "INSERT OR IGNORE" if DB_BACKEND == 'sqlite' else "INSERT IGNORE"
+
+
+def _greatest():
+    # SQLite 的多參數 MAX() 就是 GREATEST()
+    return "MAX" if DB_BACKEND == 'sqlite' else "GREATEST"
+
+
+def _upsert_clause(key_columns, assignments):
+    """
+    產生主鍵衝突時的更新子句。
+    assignments: [(欄位, 運算式)]，運算式中的 {new} 代表這次要寫入的值，例如
+                 ('PassCount', 'PassCount + {new}')
+    """
+    if DB_BACKEND == 'sqlite':
+        prefix = f"ON CONFLICT ({', '.join(key_columns)}) DO UPDATE SET "
+        new_value = "excluded.{}"
+    else:
+        prefix = "ON DUPLICATE KEY UPDATE "
+        new_value = "VALUES({})"
+    return prefix + ", ".join(
+        f"{col} = " + expr.format(new=new_value.format(col)) for col, expr in assignments
+    )
+
+
+def _overwrite(columns):
+    """_upsert_clause 用：衝突時直接以新值覆寫這些欄位。"""
+    return [(col, "{new}") for col in columns]
+
+
+# ==========================================================
+#  (新增) 增量匯入用的資料表：成績單版本號 + 異動紀錄
+# ==========================================================
+# 每次重新上傳只寫入「有變動」的 TRANSCRIPT 列，
+# 有任何異動時版本號 +1，下游快取可以拿版本號當作失效依據。
+INGEST_TABLES_DDL = [
+    """
+    CREATE TABLE IF NOT EXISTS TRANSCRIPT_VERSION (
+        StudentID VARCHAR(20) NOT NULL PRIMARY KEY,
+        Version INT NOT NULL DEFAULT 0,
+        UpdatedAt TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS TRANSCRIPT_CHANGELOG (
+        ChangeID BIGINT NOT NULL AUTO_INCREMENT PRIMARY KEY,
+        StudentID VARCHAR(20) NOT NULL,
+        Version INT NOT NULL,
+        CourseID VARCHAR(20) NOT NULL,
+        Semester VARCHAR(10) NOT NULL,
+        ChangeType VARCHAR(10) NOT NULL,  -- insert / update
+        OldGrade VARCHAR(10) NULL,
+        NewGrade VARCHAR(10) NULL,
+        OldIsPassed TINYINT NULL,
+        NewIsPassed TINYINT NULL,
+        OldRemarks VARCHAR(255) NULL,
+        NewRemarks VARCHAR(255) NULL,
+        ChangedAt TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+        INDEX idx_changelog_student (StudentID, Version)
+    )
+    """,
+]
+
+# ==========================================================
+#  (新增) 學系分析用的預先彙總表 (rollup)
+# ==========================================================
+# COURSE_STATS_ROLLUP：每門課的通過 / 未過人次，匯入時依差異增減
+# STUDENT_AUDIT_ROLLUP：每位學生一列審查摘要，匯入時整列覆寫
+# 分析 API 只查這兩張小表，不需要對每位學生重跑 calculate_graduation_audit
+ANALYTICS_TABLES_DDL = [
+    """
+    CREATE TABLE IF NOT EXISTS COURSE_STATS_ROLLUP (
+        CourseID VARCHAR(20) NOT NULL PRIMARY KEY,
+        PassCount INT NOT NULL DEFAULT 0,
+        FailCount INT NOT NULL DEFAULT 0
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS STUDENT_AUDIT_ROLLUP (
+        StudentID VARCHAR(20) NOT NULL PRIMARY KEY,
+        EnrollmentYear INT NULL,
+        Major VARCHAR(50) NULL,
+        TranscriptVersion INT NOT NULL DEFAULT 0,
+        TotalEarned DECIMAL(6,1) NOT NULL DEFAULT 0,
+        TotalRequired DECIMAL(6,1) NOT NULL DEFAULT 0,
+        CommonEarned DECIMAL(6,1) NOT NULL DEFAULT 0,
+        CommonGap DECIMAL(6,1) NOT NULL DEFAULT 0,
+        EnglishGap DECIMAL(6,1) NOT NULL DEFAULT 0,
+        ChineseGap DECIMAL(6,1) NOT NULL DEFAULT 0,
+        ServiceGap DECIMAL(6,1) NOT NULL DEFAULT 0,
+        GenEdEarned DECIMAL(6,1) NOT NULL DEFAULT 0,
+        GenEdGap DECIMAL(6,1) NOT NULL DEFAULT 0,
+        GenEdCoreMissing INT NOT NULL DEFAULT 0,
+        FailedRequiredCount INT NOT NULL DEFAULT 0,
+        UpdatedAt TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
+        INDEX idx_rollup_cohort (EnrollmentYear, Major)
+    )
+    """,
+]
+_support_tables_ready = False
+
+# STUDENT_AUDIT_ROLLUP 中由審查結果計算出來的欄位 (順序與 audit_summary 的 key 一致)
+AUDIT_ROLLUP_COLUMNS = (
+    'TotalEarned', 'TotalRequired', 'CommonEarned', 'CommonGap',
+    'EnglishGap', 'ChineseGap', 'ServiceGap',
+    'GenEdEarned', 'GenEdGap', 'GenEdCoreMissing', 'FailedRequiredCount'
+)
+
+# TRANSCRIPT 中會被重新上傳更新的欄位 (順序與 UPDATE / INSERT 參數一致)
+TRANSCRIPT_MUTABLE_COLUMNS = (
+    'Grade', 'IsPassed', 'CourseTypeAsTaken', 'Remarks',
+    'DepartmentType', 'Book', 'CumulativeCredits'
+)
+
+# ==========================================================
+#  (效能) 課程目錄快取：COURSE 幾乎不會變，整張放在記憶體裡
+# ==========================================================
+# - 第一次使用時分批 (fetchmany) 載入整張 COURSE，之後每 COURSE_CACHE_TTL_SEC 秒重新載入
+# - 匯入時已知的課號直接跳過 INSERT IGNORE INTO COURSE
+# - 讀取成績單時課名 / 學分直接查快取，不必 JOIN COURSE；查不到的才回資料庫補
+# - 新增的課程在 commit 成功後寫回快取 (write-through)
+COURSE_CACHE_TTL_SEC = 600
+COURSE_CACHE_CHUNK = 1000
+_course_cache = {}             # CourseID -> (CourseName, Credits)
+_course_cache_loaded_at = None
+_course_cache_lock = threading.Lock()
+
+
+def _get_course_catalog(connection):
+    """回傳課程目錄快取 (過期或尚未載入時從 COURSE 重新載入)。"""
+    global _course_cache, _course_cache_loaded_at
+    loaded_at = _course_cache_loaded_at
+    if loaded_at is not None and time.monotonic() - loaded_at < COURSE_CACHE_TTL_SEC:
+        return _course_cache
+
+    with _course_cache_lock:
+        if _course_cache_loaded_at is not loaded_at:
+            return _course_cache # 其他執行緒剛載入完
+        catalog = {}
+        # 不用 buffered：buffered cursor 會在 execute 時就把整張表讀進記憶體，fetchmany 分批就沒意義了。
+        # 迴圈會把結果全部讀完，之後同一個連線上的查詢不會遇到 "Unread result found"
+        cursor = connection.cursor()
+        try:
+            cursor.execute("SELECT CourseID, CourseName, Credits FROM COURSE")
+            while True:
+                rows = cursor.fetchmany(COURSE_CACHE_CHUNK)
+                if not rows:
+                    break
+                for course_id, course_name, credits in rows:
+                    catalog[course_id] = (course_name, credits)
+        finally:
+            cursor.close()
+        # 整份換掉，正在讀舊字典的執行緒不受影響
+        _course_cache = catalog
+        _course_cache_loaded_at = time.monotonic()
+        print(f">>> [Debug] 課程目錄快取已載入 {len(catalog)} 門課程")
+    return _course_cache
+
+
+def _lookup_courses(connection, course_ids):
+    """
+    查詢課名與學分：先查快取，查不到的 (例如其他 worker 剛新增的課) 再回資料庫補並寫回快取。
+    Returns: {CourseID: (CourseName, Credits)}，資料庫也沒有的課號不會出現在結果中。
+    """
+    catalog = _get_course_catalog(connection)
+    found = {}
+    missing = []
+    for course_id in course_ids:
+        entry = catalog.get(course_id)
+        if entry is None:
+            missing.append(course_id)
+        else:
+            found[course_id] = entry
+
+    if missing:
+        cursor = connection.cursor(buffered=True)
+        try:
+            placeholders = ", ".join(["%s"] * len(missing))
+            cursor.execute(
+                f"SELECT CourseID, CourseName, Credits FROM COURSE WHERE CourseID IN ({placeholders})",
+                tuple(missing)
+            )
+            for course_id, course_name, credits in cursor.fetchall():
+                found[course_id] = (course_name, credits)
+                catalog[course_id] = (course_name, credits)
+        finally:
+            cursor.close()
+    return found
+
+
+def _add_to_course_catalog(course_rows):
+    """(write-through) commit 成功後，把新寫入的課程加進快取。"""
+    catalog = _course_cache
+    for course_id, course_name, credits, _offering_dept in course_rows:
+        catalog.setdefault(course_id, (course_name, credits))
+
+
+def invalidate_course_catalog():
+    """(維護用) 手動修改 COURSE 後呼叫，下次使用時重新載入。"""
+    global _course_cache_loaded_at
+    with _course_cache_lock:
+        _course_cache_loaded_at = None
+
+
 # ==========================================================
 #  登入檢查函式：檢查學生是否存在於資料庫
 # ==========================================================
@@ -19,7 +419,7 @@ def check_user_exists(student_id):
     connection = None
     try:
         # 建立連線 (這裡會使用您檔案上方定義好的 db_config)
-        connection = mysql.connector.connect(**db_config)
+        connection = _connect()
         
         # 使用 dictionary=True 讓回傳結果變成字典
         cursor = connection.cursor(dictionary=True)
@@ -40,7 +440,7 @@ def check_user_exists(student_id):
             print(">>> 查無此人")
             return None
 
-    except Error as e:
+    except DB_ERRORS as e:
         print(f"!!! 資料庫查詢錯誤: {e}")
         return None
     finally:
@@ -50,18 +450,26 @@ def check_user_exists(student_id):
 # ==========================================================
 #  1. 儲存函式：將學生資料與課程資料存入 MySQL
 # ==========================================================
-def save_student_data(student_info, all_courses):
+def save_student_data(student_info, all_courses, audit_summary=None):
+    """
+    寫入學生與課程資料 (增量匯入)。
+    audit_summary: (選用) 審查摘要 (key 對應 AUDIT_ROLLUP_COLUMNS)，
+                   有提供時會在同一個交易裡更新 STUDENT_AUDIT_ROLLUP。
+    """
     print(">>> [Debug] 進入 save_student_data 函式")
     connection = None
     try:
-        print(f">>> [Debug] 嘗試連接 MySQL... (Host: {db_config['host']})")
+        target = f"SQLite: {SQLITE_PATH}" if DB_BACKEND == 'sqlite' else f"MySQL Host: {db_config['host']}"
+        print(f">>> [Debug] 嘗試連接資料庫... ({target})")
         
         # 1. 建立連線
-        connection = mysql.connector.connect(**db_config)
+        connection = _connect()
         
         if connection.is_connected():
-            print(">>> [Debug] MySQL 連線成功！")
+            print(">>> [Debug] 資料庫連線成功！")
             cursor = connection.cursor()
+            # DDL 會觸發 implicit commit，所以要在寫入任何資料之前先建表
+            _ensure_support_tables(cursor)
             
             # 2. 寫入學生
             print(f">>> [Debug] 準備寫入學生: {student_info['id']}")
@@ -71,16 +479,12 @@ def save_student_data(student_info, all_courses):
             major_name = parts[0] if len(parts) > 0 else raw_dept
             status = parts[1] if len(parts) > 1 else "一般生"
             
-            sql_student = """
-            INSERT INTO STUDENT (StudentID, StudentName, EnrollmentYear, Department, Major, StudentStatus)
-            VALUES (%s, %s, %s, %s, %s, %s)
-            ON DUPLICATE KEY UPDATE
-                StudentName = VALUES(StudentName),
-                EnrollmentYear = VALUES(EnrollmentYear),
-                Department = VALUES(Department),
-                Major = VALUES(Major),
-                StudentStatus = VALUES(StudentStatus);
-            """
+            sql_student = (
+                "INSERT INTO STUDENT (StudentID, StudentName, EnrollmentYear, Department, Major, StudentStatus) "
+                "VALUES (%s, %s, %s, %s, %s, %s) " +
+                _upsert_clause(('StudentID',), _overwrite(
+                    ('StudentName', 'EnrollmentYear', 'Department', 'Major', 'StudentStatus')))
+            )
             cursor.execute(sql_student, (
                 student_info['id'], 
                 student_info['name'], 
@@ -93,52 +497,23 @@ def save_student_data(student_info, all_courses):
 
             
             
-            # 4. 寫入課程
-            print(f">>> [Debug] 開始寫入 {len(all_courses)} 筆課程...")
-            
-            for i, course in enumerate(all_courses):
-                # 每處理 10 筆印一次進度，避免卡住不知道
-                if i % 10 == 0:
-                    print(f"    處理第 {i} 筆...")
-
-                course_id = course.get('課號')
-                if not course_id: continue
-
-                course_name = course.get('課名', '未知課程')
-                credits = course.get('學分', 0)
-                offering_dept = course_id[:2] if len(course_id) >= 2 else "OT"
-                
-                # 課程
-                sql_course = "INSERT IGNORE INTO COURSE (CourseID, CourseName, Credits, OfferingDepartment) VALUES (%s, %s, %s, %s)"
-                cursor.execute(sql_course, (course_id, course_name, credits, offering_dept))
-
-                # 修課紀錄
-                semester_str = f"{course.get('學年')}-{course.get('期')}"
-                is_passed = 1 if course.get('得分') == '通過' else 0
-                
-                sql_transcript = """
-                INSERT INTO TRANSCRIPT 
-                (StudentID, CourseID, Semester, Grade, IsPassed, CourseTypeAsTaken, Remarks, DepartmentType, Book, CumulativeCredits)
-                VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
-                ON DUPLICATE KEY UPDATE
-                    Grade = VALUES(Grade),
-                    IsPassed = VALUES(IsPassed),
-                    CourseTypeAsTaken = VALUES(CourseTypeAsTaken),
-                    Remarks = VALUES(Remarks),
-                    DepartmentType = VALUES(DepartmentType),
-                    Book = VALUES(Book),
-                    CumulativeCredits = VALUES(CumulativeCredits);
-                """
-                cursor.execute(sql_transcript, (
-                    student_info['id'], course_id, semester_str, course.get('分數'), is_passed,
-                    course.get('選別'), course.get('說明'), course.get('系所'), course.get('冊'), course.get('累計')
-                ))
+            # 4. 寫入課程 (增量：只處理新增或有變動的列)
+            summary = ingest_transcript_delta(connection, cursor, student_info['id'], all_courses)
+            print(f">>> [Debug] 增量匯入完成: 新增 {summary['inserted']} 筆, "
+                  f"更新 {summary['updated']} 筆, 未變動 {summary['unchanged']} 筆, "
+                  f"版本 v{summary['version']}")
+
+            # 5. (新增) 更新學系分析彙總表
+            if audit_summary:
+                _upsert_audit_rollup(cursor, student_info['id'], summary['version'], audit_summary)
+                print(">>> [Debug] 分析彙總表更新完成")
 
             connection.commit()
+            _add_to_course_catalog(summary['new_courses'])
             print(">>> [Debug] 全部完成！已 Commit。")
             return True
 
-    except Error as e:
+    except DB_ERRORS as e:
         print(f"!!! [嚴重錯誤] 資料庫操作失敗: {e}")
         return False
         
@@ -148,6 +523,370 @@ def save_student_data(student_info, all_courses):
             connection.close()
             print(">>> [Debug] 連線已關閉")
 
+# ==========================================================
+#  1.1 (新增) 增量匯入：比對資料庫現有成績單，只寫入差異
+# ==========================================================
+def _ensure_support_tables(cursor):
+    """第一次使用時建立版本號 / 異動紀錄 / 分析彙總資料表 (每個行程只做一次)。"""
+    global _support_tables_ready
+    if _support_tables_ready or DB_BACKEND == 'sqlite':
+        return # SQLite 在開啟連線時就已建好全部資料表
+    for ddl in INGEST_TABLES_DDL + ANALYTICS_TABLES_DDL:
+        cursor.execute(ddl)
+    _support_tables_ready = True
+
+
+def _normalize_db_value(value):
+    """把資料庫回傳的 int / Decimal 與 PDF 解析出來的字串統一成可比較的格式。"""
+    return None if value is None else str(value)
+
+
+def _transcript_row_values(course):
+    """從解析出來的課程字典取出 TRANSCRIPT_MUTABLE_COLUMNS 對應的值。"""
+    is_passed = 1 if course.get('得分') == '通過' else 0
+    return (
+        course.get('分數'), is_passed, course.get('選別'), course.get('說明'),
+        course.get('系所'), course.get('冊'), course.get('累計')
+    )
+
+
+def ingest_transcript_delta(connection, cursor, student_id, all_courses):
+    """
+    比對解析出來的課程列表與資料庫中該學生的 TRANSCRIPT：
+    - 新的 (課號, 學期) -> INSERT (並補上 COURSE)
+    - 成績 / 通過狀態 / 說明等欄位有變 -> UPDATE
+    - 完全相同 -> 略過
+    有任何異動時，版本號 +1 並寫入 TRANSCRIPT_CHANGELOG。
+    課程目錄快取中已有的課號不會再送 INSERT IGNORE INTO COURSE。
+    呼叫端負責 commit，commit 成功後再把 new_courses 寫回課程目錄快取。
+
+    Returns:
+        {"version", "inserted", "updated", "unchanged", "new_courses"}
+    """
+    _ensure_support_tables(cursor)
+    catalog = _get_course_catalog(connection)
+
+    # 1. 讀取現有成績單
+    cursor.execute(
+        "SELECT CourseID, Semester, " + ", ".join(TRANSCRIPT_MUTABLE_COLUMNS) +
+        " FROM TRANSCRIPT WHERE StudentID = %s",
+        (student_id,)
+    )
+    existing = {}      # (課號, 學期) -> 正規化後的欄位值 (用來比對)
+    existing_raw = {}  # (課號, 學期) -> 資料庫原始值 (用來寫異動紀錄)
+    for row in cursor.fetchall():
+        existing[(row[0], row[1])] = tuple(_normalize_db_value(v) for v in row[2:])
+        existing_raw[(row[0], row[1])] = row[2:]
+
+    # 2. 分類：新增 / 更新 / 未變動
+    course_rows = []
+    insert_rows = []
+    update_rows = []
+    changelog = []
+    unchanged = 0
+    stats_delta = {} # 課號 -> [通過人次增減, 未過人次增減]，用來更新 COURSE_STATS_ROLLUP
+
+    for course in all_courses:
+        course_id = course.get('課號')
+        if not course_id: continue
+
+        semester_str = f"{course.get('學年')}-{course.get('期')}"
+        values = _transcript_row_values(course)
+        normalized = tuple(_normalize_db_value(v) for v in values)
+        key = (course_id, semester_str)
+        old = existing.get(key)
+
+        if old is None:
+            course_name = course.get('課名', '未知課程')
+            credits = course.get('學分', 0)
+            offering_dept = course_id[:2] if len(course_id) >= 2 else "OT"
+            if course_id not in catalog:
+                course_rows.append((course_id, course_name, credits, offering_dept))
+            insert_rows.append((student_id, course_id, semester_str) + values)
+            delta = stats_delta.setdefault(course_id, [0, 0])
+            delta[0 if values[1] else 1] += 1
+            changelog.append((course_id, semester_str, 'insert', None, values[0], None, values[1], None, values[3]))
+        elif old != normalized:
+            old_raw = existing_raw[key]
+            update_rows.append(values + (student_id, course_id, semester_str))
+            if _normalize_db_value(old_raw[1]) != _normalize_db_value(values[1]):
+                delta = stats_delta.setdefault(course_id, [0, 0])
+                delta[0 if values[1] else 1] += 1
+                delta[1 if values[1] else 0] -= 1
+            changelog.append((course_id, semester_str, 'update', old_raw[0], values[0], old_raw[1], values[1], old_raw[3], values[3]))
+        else:
+            unchanged += 1
+        # 同一份 PDF 內重複出現的列，以最後一筆為準 (與 ON DUPLICATE KEY UPDATE 相同)
+        existing[key] = normalized
+        existing_raw[key] = values
+
+    # 3. 寫入差異
+    if course_rows:
+        sql_course = _insert_ignore() + " INTO COURSE (CourseID, CourseName, Credits, OfferingDepartment) VALUES (%s, %s, %s, %s)"
+        cursor.executemany(sql_course, course_rows)
+
+    if insert_rows:
+        sql_insert = (
+            "INSERT INTO TRANSCRIPT "
+            "(StudentID, CourseID, Semester, Grade, IsPassed, CourseTypeAsTaken, Remarks, DepartmentType, Book, CumulativeCredits) "
+            "VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s) " +
+            _upsert_clause(('StudentID', 'CourseID', 'Semester'), _overwrite(TRANSCRIPT_MUTABLE_COLUMNS))
+        )
+        cursor.executemany(sql_insert, insert_rows)
+
+    if update_rows:
+        sql_update = (
+            "UPDATE TRANSCRIPT SET " +
+            ", ".join(f"{col} = %s" for col in TRANSCRIPT_MUTABLE_COLUMNS) +
+            " WHERE StudentID = %s AND CourseID = %s AND Semester = %s"
+        )
+        cursor.executemany(sql_update, update_rows)
+
+    stats_rows = [(cid, d[0], d[1]) for cid, d in stats_delta.items() if d != [0, 0]]
+    if stats_rows:
+        sql_stats = (
+            "INSERT INTO COURSE_STATS_ROLLUP (CourseID, PassCount, FailCount) VALUES (%s, %s, %s) " +
+            _upsert_clause(('CourseID',), [('PassCount', 'PassCount + {new}'), ('FailCount', 'FailCount + {new}')])
+        )
+        cursor.executemany(sql_stats, stats_rows)
+
+    # 4. 版本號 + 異動紀錄
+    if changelog:
+        cursor.execute(
+            "INSERT INTO TRANSCRIPT_VERSION (StudentID, Version) VALUES (%s, 1) " +
+            _upsert_clause(('StudentID',), [('Version', 'Version + 1'), ('UpdatedAt', 'CURRENT_TIMESTAMP')]),
+            (student_id,)
+        )
+    cursor.execute("SELECT Version FROM TRANSCRIPT_VERSION WHERE StudentID = %s", (student_id,))
+    version_row = cursor.fetchone()
+    version = version_row[0] if version_row else 0
+
+    if changelog:
+        sql_changelog = """
+        INSERT INTO TRANSCRIPT_CHANGELOG
+        (StudentID, Version, CourseID, Semester, ChangeType, OldGrade, NewGrade, OldIsPassed, NewIsPassed, OldRemarks, NewRemarks)
+        VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
+        """
+        cursor.executemany(sql_changelog, [(student_id, version) + entry for entry in changelog])
+
+    return {
+        "version": version,
+        "inserted": len(insert_rows),
+        "updated": len(update_rows),
+        "unchanged": unchanged,
+        "new_courses": course_rows
+    }
+
+
+def get_transcript_version(student_id):
+    """讀取學生目前的成績單版本號 (從未匯入過回傳 0，查詢失敗回傳 None)。"""
+    connection = None
+    try:
+        connection = _connect()
+        cursor = connection.cursor()
+        cursor.execute("SELECT Version FROM TRANSCRIPT_VERSION WHERE StudentID = %s", (student_id,))
+        row = cursor.fetchone()
+        return row[0] if row else 0
+    except DB_ERRORS as e:
+        print(f"!!! [版本查詢錯誤] {e}")
+        return None
+    finally:
+        if connection and connection.is_connected():
+            cursor.close()
+            connection.close()
+
+def _upsert_audit_rollup(cursor, student_id, version, audit_summary):
+    """寫入 / 覆寫一位學生的 STUDENT_AUDIT_ROLLUP (入學年度與組別直接取自 STUDENT)。"""
+    placeholders = ", ".join(["%s"] * len(AUDIT_ROLLUP_COLUMNS))
+    sql_rollup = (
+        "INSERT INTO STUDENT_AUDIT_ROLLUP (StudentID, EnrollmentYear, Major, TranscriptVersion, " +
+        ", ".join(AUDIT_ROLLUP_COLUMNS) + ") " +
+        f"SELECT StudentID, EnrollmentYear, Major, %s, {placeholders} FROM STUDENT WHERE StudentID = %s " +
+        _upsert_clause(('StudentID',),
+                       _overwrite(('EnrollmentYear', 'Major', 'TranscriptVersion') + AUDIT_ROLLUP_COLUMNS) +
+                       [('UpdatedAt', 'CURRENT_TIMESTAMP')])
+    )
+    cursor.execute(sql_rollup, (version,) + tuple(audit_summary[col] for col in AUDIT_ROLLUP_COLUMNS) + (student_id,))
+
+
+def save_audit_rollup(student_id, audit_summary):
+    """(維護用) 只更新某位學生的審查彙總列，不重新匯入成績單。"""
+    connection = None
+    try:
+        connection = _connect()
+        cursor = connection.cursor()
+        _ensure_support_tables(cursor)
+        cursor.execute("SELECT Version FROM TRANSCRIPT_VERSION WHERE StudentID = %s", (student_id,))
+        row = cursor.fetchone()
+        _upsert_audit_rollup(cursor, student_id, row[0] if row else 0, audit_summary)
+        connection.commit()
+        return True
+    except DB_ERRORS as e:
+        print(f"!!! [彙總表寫入錯誤] {e}")
+        return False
+    finally:
+        if connection and connection.is_connected():
+            cursor.close()
+            connection.close()
+
+
+# ==========================================================
+#  1.2 (新增) 學系分析查詢：只讀預先彙總表
+# ==========================================================
+def get_course_pass_rates(min_attempts=1):
+    """每門課的通過 / 未過人次與比率 (依修課人次排序)。"""
+    connection = None
+    try:
+        connection = _connect()
+        cursor = connection.cursor(dictionary=True)
+        _ensure_support_tables(cursor)
+        sql = """
+        SELECT CourseID, PassCount, FailCount
+        FROM COURSE_STATS_ROLLUP
+        WHERE PassCount + FailCount >= %s
+        ORDER BY PassCount + FailCount DESC, CourseID
+        """
+        cursor.execute(sql, (min_attempts,))
+        rows = cursor.fetchall()
+        # 快取裡沒有的課號 (例如其他 worker 剛新增的課) 會回資料庫補
+        courses = _lookup_courses(connection, [row['CourseID'] for row in rows])
+        results = []
+        for row in rows:
+            attempts = row['PassCount'] + row['FailCount']
+            results.append({
+                "course_id": row['CourseID'],
+                "course_name": courses.get(row['CourseID'], (None, None))[0],
+                "pass_count": row['PassCount'],
+                "fail_count": row['FailCount'],
+                "pass_rate": round(row['PassCount'] / attempts, 4) if attempts else None,
+                "fail_rate": round(row['FailCount'] / attempts, 4) if attempts else None
+            })
+        return results
+    except DB_ERRORS as e:
+        print(f"!!! [分析查詢錯誤] {e}")
+        return None
+    finally:
+        if connection and connection.is_connected():
+            cursor.close()
+            connection.close()
+
+
+def get_credit_gap_distribution():
+    """
+    共同必修 / 通識各類缺額的分佈：{類別: [{"gap": 缺額, "students": 人數}, ...]}
+    """
+    gap_columns = {
+        "共同必修": "CommonGap",
+        "英語": "EnglishGap",
+        "國文": "ChineseGap",
+        "服務學習": "ServiceGap",
+        "通識": "GenEdGap",
+        "通識核心缺漏領域數": "GenEdCoreMissing",
+    }
+    connection = None
+    try:
+        connection = _connect()
+        cursor = connection.cursor()
+        _ensure_support_tables(cursor)
+        distribution = {}
+        for label, col in gap_columns.items():
+            # col 來自上方固定的白名單，不是使用者輸入
+            cursor.execute(f"SELECT {col}, COUNT(*) FROM STUDENT_AUDIT_ROLLUP GROUP BY {col} ORDER BY {col}")
+            distribution[label] = [
+                {"gap": float(gap), "students": count} for gap, count in cursor.fetchall()
+            ]
+        return distribution
+    except DB_ERRORS as e:
+        print(f"!!! [分析查詢錯誤] {e}")
+        return None
+    finally:
+        if connection and connection.is_connected():
+            cursor.close()
+            connection.close()
+
+
+def get_at_risk_summary(current_ro_year, max_credits_per_semester=25, semesters_to_graduate=8):
+    """
+    依入學年度與組別統計「可能無法如期畢業」的學生人數。
+    判斷方式：剩餘學分 > 剩餘學期數 x 每學期學分上限 (已超過修業年限且學分未滿也算)。
+    剩餘學期數依查詢當下的學年度計算，所以彙總表不會因為時間經過而過期。
+    current_ro_year: 目前的「學年度」(8 月起算，見 app.current_academic_year)，不是日曆年 - 1911。
+    """
+    connection = None
+    try:
+        connection = _connect()
+        cursor = connection.cursor(dictionary=True)
+        _ensure_support_tables(cursor)
+        greatest = _greatest()
+        sql = f"""
+        SELECT EnrollmentYear, Major, COUNT(*) AS Students,
+               SUM(CASE WHEN {greatest}(TotalRequired - TotalEarned, 0)
+                             > {greatest}(%s - (%s - EnrollmentYear) * 2, 0) * %s
+                        THEN 1 ELSE 0 END) AS AtRisk,
+               AVG({greatest}(TotalRequired - TotalEarned, 0)) AS AvgRemaining
+        FROM STUDENT_AUDIT_ROLLUP
+        GROUP BY EnrollmentYear, Major
+        ORDER BY EnrollmentYear, Major
+        """
+        cursor.execute(sql, (semesters_to_graduate, current_ro_year, max_credits_per_semester))
+        return [{
+            "enrollment_year": row['EnrollmentYear'],
+            "major": row['Major'],
+            "students": row['Students'],
+            "at_risk": int(row['AtRisk'] or 0),
+            "avg_remaining_credits": round(float(row['AvgRemaining'] or 0), 1)
+        } for row in cursor.fetchall()]
+    except DB_ERRORS as e:
+        print(f"!!! [分析查詢錯誤] {e}")
+        return None
+    finally:
+        if connection and connection.is_connected():
+            cursor.close()
+            connection.close()
+
+
+def rebuild_course_stats_rollup():
+    """(維護用) 從 TRANSCRIPT 重新計算整張 COURSE_STATS_ROLLUP，例如第一次部署時補資料。"""
+    connection = None
+    try:
+        connection = _connect()
+        cursor = connection.cursor()
+        _ensure_support_tables(cursor)
+        cursor.execute("DELETE FROM COURSE_STATS_ROLLUP")
+        cursor.execute("""
+        INSERT INTO COURSE_STATS_ROLLUP (CourseID, PassCount, FailCount)
+        SELECT CourseID, SUM(IsPassed = 1), SUM(IsPassed <> 1)
+        FROM TRANSCRIPT
+        GROUP BY CourseID
+        """)
+        connection.commit()
+        return True
+    except DB_ERRORS as e:
+        print(f"!!! [彙總表重建錯誤] {e}")
+        return False
+    finally:
+        if connection and connection.is_connected():
+            cursor.close()
+            connection.close()
+
+
+def list_student_ids():
+    """(維護用) 列出所有學號，給彙總表補資料使用。"""
+    connection = None
+    try:
+        connection = _connect()
+        cursor = connection.cursor()
+        cursor.execute("SELECT StudentID FROM STUDENT")
+        return [row[0] for row in cursor.fetchall()]
+    except DB_ERRORS as e:
+        print(f"!!! [資料庫查詢錯誤] {e}")
+        return []
+    finally:
+        if connection and connection.is_connected():
+            cursor.close()
+            connection.close()
+
+
 # ==========================================================
 #  2. (新增) 讀取函式：給 AI 對話用
 # ==========================================================
@@ -159,7 +898,7 @@ def get_student_data_from_db(student_id):
     print(f">>> [Debug] 正在從資料庫讀取學號: {student_id}")
     connection = None
     try:
-        connection = mysql.connector.connect(**db_config)
+        connection = _connect()
         if not connection.is_connected():
             return None, None
 
@@ -183,30 +922,33 @@ def get_student_data_from_db(student_id):
             "department": f"{student_row['Department']} {student_row['Major']}" 
         }
 
-        # 2. 讀取修課紀錄 (JOIN TRANSCRIPT 與 COURSE 以取得課名與學分)
+        # 2. 讀取修課紀錄 (課名與學分改查課程目錄快取，不再 JOIN COURSE)
         sql_courses = """
         SELECT 
             t.DepartmentType, -- 系所
             t.CourseID,       -- 課號
             t.Book,           -- 冊
             t.Semester,       -- 學期 (格式 110-1)
-            c.CourseName,     -- 課名
             t.CourseTypeAsTaken, -- 選別
             t.IsPassed,       -- 通過狀態 (1/0)
-            c.Credits,        -- 學分
             t.CumulativeCredits, -- 累計
             t.Grade,          -- 分數
             t.Remarks         -- 說明
         FROM TRANSCRIPT t
-        JOIN COURSE c ON t.CourseID = c.CourseID
         WHERE t.StudentID = %s
         ORDER BY t.Semester DESC
         """
         cursor.execute(sql_courses, (student_id,))
         course_rows = cursor.fetchall()
+        course_lookup = _lookup_courses(connection, {row['CourseID'] for row in course_rows})
 
         all_courses = []
         for row in course_rows:
+            # 與原本的 JOIN 相同：COURSE 沒有的課號就略過
+            if row['CourseID'] not in course_lookup:
+                continue
+            row['CourseName'], row['Credits'] = course_lookup[row['CourseID']]
+
             # 處理學期 (把 "110-1" 拆開)
             semester_parts = row['Semester'].split('-')
             year = semester_parts[0] if len(semester_parts) > 0 else ""
@@ -246,7 +988,7 @@ def get_student_data_from_db(student_id):
         print(f">>> [Debug] 成功讀取 {len(all_courses)} 筆課程資料")
         return student_info, all_courses
 
-    except Error as e:
+    except DB_ERRORS as e:
         print(f"!!! [讀取錯誤] 資料庫查詢失敗: {e}")
         return None, None
     finally:
@@ -0,0 +1,12 @@
+# ==========================================================
+#  WSGI 入口 (給 gunicorn 等 pre-fork 伺服器使用)
+#
+#  gunicorn --preload -w 4 -b 0.0.0.0:5000 wsgi:app
+#
+#  --preload 會讓 master 先執行這個檔案 (含 warm_up)，
+#  之後 fork 出來的 worker 直接共用已載入的 groq 模組。
+#  pdfplumber 由 PDF 解析沙盒的 worker 行程各自載入，不在這裡預熱。
+# ==========================================================
+from app import app, warm_up
+
+warm_up()